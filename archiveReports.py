@@ -0,0 +1,74 @@
+"""
+Moves the reports of closed years out of maintenance.db into per-year archive databases.
+
+    python archiveReports.py --list
+    python archiveReports.py --through 2019 --vacuum
+
+Each year goes to maintenance_<year>.db next to maintenance.db (see maintenance/archive.py).
+The KPIs are unaffected: breakdown_intervals keeps every year. mtbr.py / mtbrQuarter.py
+--verify attach the archives their windows reach. reportUpdate.py skips the rows of
+archived years, so run this only for years whose reports no longer change.
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from maintenance import connect, get_db_path
+from maintenance.archive import archive_path, archive_year
+from maintenance.schema import ensure_report_archives
+
+parser = argparse.ArgumentParser(description='Move the reports of closed years into per-year archive databases.')
+parser.add_argument('--db', help='Path of maintenance.db (default: MAINTENANCE_DB / maintenance.ini).')
+parser.add_argument('--year', type=int, action='append', default=[], help='Archive this year (repeatable).')
+parser.add_argument('--through', type=int, metavar='YEAR',
+                    help='Archive every year from the oldest report through YEAR.')
+parser.add_argument('--list', action='store_true', help='List the archived years and the years still in maintenance.db.')
+parser.add_argument('--vacuum', action='store_true', help='VACUUM maintenance.db afterwards to give the space back.')
+args = parser.parse_args()
+
+db_path = args.db or get_db_path()
+this_year = datetime.now().year
+if any(year >= this_year for year in [*args.year, args.through or 0]):
+    parser.error(f'only closed years (before {this_year}) can be archived')
+if not (args.year or args.through or args.list or args.vacuum):
+    parser.error('give --year, --through, --list or --vacuum')
+
+try:
+    # isolation_level=None: archive_year runs its own transactions
+    with connect(db_path, isolation_level=None) as db:
+        cursor = db.cursor()
+
+        years = set(args.year)
+        if args.through:
+            # START_TS counts wall-clock seconds, so 'unixepoch' gives the report's own year
+            cursor.execute("SELECT CAST(strftime('%Y', MIN(START_TS), 'unixepoch') AS integer) FROM reports")
+            first_year = cursor.fetchone()[0]
+            if first_year is not None:
+                years.update(range(first_year, args.through + 1))
+
+        for year in sorted(years):
+            year_start = time.perf_counter()
+            moved = archive_year(cursor, year, db_path)
+            print(f"Moved {moved} reports of {year} to {archive_path(year, db_path).name} "
+                  f"in {time.perf_counter() - year_start:.2f} seconds.")
+
+        if args.vacuum:
+            size_before = os.path.getsize(db_path)
+            cursor.execute('VACUUM')
+            print(f"VACUUM: {size_before / 2**20:.1f} MiB -> {os.path.getsize(db_path) / 2**20:.1f} MiB.")
+
+        if args.list:
+            ensure_report_archives(cursor)
+            cursor.execute("SELECT YEAR, PATH, ROWS, ARCHIVED FROM report_archives ORDER BY YEAR")
+            for year, path, rows, archived in cursor.fetchall():
+                present = 'present' if os.path.exists(archive_path(year, db_path)) else 'MISSING'
+                print(f"{year}: {rows} reports in {path} ({present}), archived {archived}")
+            cursor.execute('''SELECT CAST(strftime('%Y', START_TS, 'unixepoch') AS integer), COUNT(*)
+                              FROM reports WHERE START_TS IS NOT NULL GROUP BY 1 ORDER BY 1''')
+            for year, rows in cursor.fetchall():
+                print(f"{year}: {rows} reports in {os.path.basename(db_path)}")
+
+except sqlite3.Error as e:
+    print(f"[ERROR] Database error: {e}")
@@ -0,0 +1,150 @@
+"""
+Benchmark for reportUpdate.py: the default INSERT OR IGNORE import against --bulk.
+
+Writes a synthetic reports.csv (1,000,000 rows by default) and imports it into a fresh
+database with each mode: the initial load, a forced re-import of the same file, the
+same file again (skipped through ingest_manifest) and a file in which 1% of the
+notifications were edited.
+
+    python benchmarks/benchIngest.py --rows 1000000
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPORT_UPDATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'reportUpdate.py')
+
+# Same schema as the reports table in createTable.py, with the index from migrateDb.py
+REPORTS_DDL = """CREATE TABLE reports(NOTIFICATION integer PRIMARY KEY,
+	DATE text, DESCRIPTION text, PLANT integer, DEPARTMENT text,
+	WORK_CENTER integer, EQUIPMENT integer, BREAKDOWN text, DOWNTIME integer,
+	REPORTED text, START_DATE text, START_TIME text, FINISH_DATE text,
+	FINISH_TIME integer, START_TS integer, FINISH_TS integer)"""
+REPORTS_INDEX = "CREATE INDEX reports_equipment_breakdown_start ON reports(EQUIPMENT, BREAKDOWN, START_TS)"
+
+
+# --- Helper Function: Synthetic Data ---
+def synthetic_report_rows(rows, machines, seed=2016):
+    """Yields SAP-style reports.csv rows, including 24:00:00 finishes and missing FINISH values."""
+    rng = random.Random(seed)
+    first_day = datetime(2016, 1, 1)
+    span_minutes = int((datetime.now() - first_day).total_seconds() // 60)
+
+    for i in range(rows):
+        equipment = 10000000 + rng.randrange(machines)
+        start = first_day + timedelta(minutes=rng.randrange(span_minutes))
+        finish = start + timedelta(minutes=rng.randrange(5, 720))
+        start_date, start_time = start.strftime('%m/%d/%Y'), start.strftime('%H:%M:%S')
+        finish_date, finish_time = finish.strftime('%m/%d/%Y'), finish.strftime('%H:%M:%S')
+
+        edge = rng.random()
+        if edge < 0.01:
+            # Legacy rows that end "at midnight" of the start day
+            finish_date, finish_time = start_date, '24:00:00'
+        elif edge < 0.02:
+            # Open notifications without a finish yet
+            finish_date, finish_time = '', ''
+
+        yield [
+            20000000 + i, start_date, f'Breakdown {i}', 1000, f'DEPT{equipment % 20}',
+            5000 + equipment % 150, equipment, 'X' if rng.random() < 0.8 else '',
+            int((finish - start).total_seconds() // 60), '', f'USER{i % 50}',
+            start_date, start_time, finish_date, finish_time,
+        ]
+
+def write_csv(path, rows):
+    """Writes an iterable of rows to a reports.csv-style file with a header row."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Notification', 'Date', 'Description', 'Plant', 'Location', 'Cost Center',
+                         'Equipment', 'Breakdown', 'Downtime', 'Blank', 'Reported by', 'Start Date',
+                         'Start Time', 'Finish Date', 'Finish Time'])
+        writer.writerows(rows)
+
+def edited_rows(source_path, fraction, seed=7):
+    """Yields the rows of an existing CSV with a fraction of them given a later FINISH_TIME and DOWNTIME."""
+    rng = random.Random(seed)
+    with open(source_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            if rng.random() < fraction:
+                row[8] = str(int(row[8] or 0) + 15)
+                row[14] = '23:30:00'
+            yield row
+
+
+# --- Helper Function: Runs ---
+def create_database(path):
+    """Creates an empty database with the indexed reports table."""
+    with sqlite3.connect(path) as db:
+        db.execute(REPORTS_DDL)
+        db.execute(REPORTS_INDEX)
+
+def run_import(db_path, csv_path, bulk, force=False):
+    """Runs reportUpdate.py once and returns (seconds, last output line)."""
+    command = [sys.executable, REPORT_UPDATE, '--db', db_path, '--csv', csv_path]
+    if bulk:
+        command.append('--bulk')
+    if force:
+        command.append('--force')
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    lines = [line for line in result.stdout.splitlines() if line.strip()]
+    summary = next((line for line in lines if 'Reports added' in line), lines[-1] if lines else '')
+    return elapsed, summary
+
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description='Compare the default and --bulk reportUpdate.py imports.')
+    parser.add_argument('--rows', type=int, default=1000000, help='Number of synthetic notifications.')
+    parser.add_argument('--machines', type=int, default=5000, help='Number of distinct EQUIPMENT values.')
+    parser.add_argument('--workdir', help='Directory for the CSV and databases (default: a temp dir).')
+    parser.add_argument('--json', help='Also write the results to this JSON file.')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='benchIngest-')
+    os.makedirs(workdir, exist_ok=True)
+    base_csv = os.path.join(workdir, 'reports.csv')
+    edited_csv = os.path.join(workdir, 'reports_edited.csv')
+
+    print(f"Writing {args.rows} synthetic reports to {workdir}")
+    write_csv(base_csv, synthetic_report_rows(args.rows, args.machines))
+    write_csv(edited_csv, edited_rows(base_csv, 0.01))
+
+    results = []
+    for mode, bulk in (('default', False), ('bulk', True)):
+        db_path = os.path.join(workdir, f'maintenance_{mode}.db')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        create_database(db_path)
+
+        # 're-import' reads the same file again (--force); 'unchanged' is the ingest_manifest skip
+        for phase, csv_path, force in (('initial load', base_csv, False), ('re-import', base_csv, True),
+                                       ('unchanged', base_csv, False), ('1% edited', edited_csv, False)):
+            elapsed, summary = run_import(db_path, csv_path, bulk, force)
+            results.append({
+                'mode': mode, 'phase': phase, 'rows': args.rows,
+                'seconds': round(elapsed, 3), 'rows_per_sec': round(args.rows / elapsed),
+                'summary': summary,
+            })
+            print(f"{mode:<8} {phase:<13} {elapsed:8.2f} s {args.rows / elapsed:10.0f} rows/sec  {summary}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
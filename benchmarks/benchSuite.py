@@ -0,0 +1,301 @@
+"""
+End-to-end benchmark of the maintenance.db scripts on a synthetic database.
+
+Generates a machine list and a reports.csv at the chosen scale (with the 24:00:00 and
+missing FINISH edge cases from benchIngest.py), then runs every job the way it runs in
+production, each as its own process against a fresh database:
+
+    machineUpdate.py, reportUpdate.py, createTable.py, mbtrMachineUpdate.py,
+    mtbrQuarter.py (first run and incremental re-run after a 1% edit), mtbr.py
+
+then adds a machine whose reports arrive before its quarterly rows exist and checks that
+the incremental mtbrQuarter.py run leaves the closed quarters exactly as --full does. It
+records per-phase wall time, throughput and peak RSS as JSON, plus the memory per
+breakdown of the loaded intervals. Compare two runs with --compare to spot regressions.
+
+    python benchmarks/benchSuite.py --scale small --json small.json
+    python benchmarks/benchSuite.py --scale small --compare small.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+
+from benchIngest import REPORTS_DDL, REPORTS_INDEX, edited_rows, synthetic_report_rows, write_csv
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from maintenance.intervals import IntervalStore
+
+# (machines, notifications) per --scale
+SCALES = {
+    'tiny': (100, 10000),
+    'small': (1000, 100000),
+    'medium': (10000, 1000000),
+    'large': (10000, 5000000),
+}
+
+# Same schema as the commented DDL in createTable.py
+MACHINES_DDL = """CREATE TABLE machines(EQUIPMENT integer PRIMARY KEY, DESCRIPTION text, PLANT integer,
+	DEPARTMENT text, WORK_CENTER integer)"""
+KPI_DDL = """CREATE TABLE kpi(EQUIPMENT integer PRIMARY KEY,
+	MTBR_ALL integer, MTBR_PREVIOUS integer, MTBR_YTD integer, MTBR_MONTH integer,
+	MTTR_ALL integer, MTTR_PREVIOUS integer, MTTR_YTD integer, MTTR_MONTH integer,
+	DT_ALL integer, DT_PREVIOUS integer, DT_YTD integer, DT_MONTH integer)"""
+
+
+# --- Helper Function: Synthetic Data ---
+def write_machine_list(path, machines):
+    """Writes a 'machine list.csv' export with the same EQUIPMENT / DEPARTMENT / WORK_CENTER as the reports."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Equipment', 'Description', 'Location', 'Cost Center', 'Plant'])
+        for i in range(machines):
+            equipment = 10000000 + i
+            writer.writerow([equipment, f'Machine {i}', f'DEPT{equipment % 20}', 5000 + equipment % 150, 1000])
+
+def create_database(path, machines):
+    """Creates an empty maintenance.db with the machines, reports and kpi tables, and a kpi row per machine."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    with sqlite3.connect(path) as db:
+        db.execute(MACHINES_DDL)
+        db.execute(REPORTS_DDL)
+        db.execute(REPORTS_INDEX)
+        db.execute(KPI_DDL)
+        # No script fills kpi; production has one row per machine there
+        db.executemany("INSERT INTO kpi(EQUIPMENT) VALUES (?)", [(10000000 + i,) for i in range(machines)])
+
+def new_machine_rows(machines, rows=200, seed=99):
+    """Yields reports.csv rows of machine 10000000 + machines, the one write_machine_list(machines + 1) adds."""
+    equipment = 10000000 + machines
+    for i, row in enumerate(synthetic_report_rows(rows, 1, seed)):
+        row[0], row[4], row[5], row[6] = 30000000 + i, f'DEPT{equipment % 20}', 5000 + equipment % 150, equipment
+        yield row
+
+
+# --- Helper Function: Runs ---
+def run_phase(name, script, args, db_path, rows=None):
+    """
+    Runs one script as a child process and returns its result record.
+
+    Peak RSS comes from the child's own rusage where the OS reports it (Linux, macOS),
+    otherwise from polling psutil when it is installed, otherwise it is None.
+    """
+    env = dict(os.environ, MAINTENANCE_DB=db_path)
+    command = [sys.executable, os.path.join(ROOT, script), *args]
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, cwd=ROOT)
+    peak_rss = None
+    if hasattr(os, 'wait4'):
+        # Read the output first so a chatty script cannot block on a full pipe
+        output = process.stdout.read()
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        peak_rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    else:
+        watcher = psutil.Process(process.pid) if psutil else None
+        while process.poll() is None:
+            if watcher:
+                try:
+                    info = watcher.memory_info()
+                    peak_rss = max(peak_rss or 0, getattr(info, 'peak_wset', info.rss))
+                except psutil.Error:
+                    pass
+            time.sleep(0.05)
+        output = process.stdout.read()
+    elapsed = time.perf_counter() - start
+    output = output.decode(errors='replace')
+
+    lines = [line for line in output.splitlines() if line.strip()]
+    record = {
+        'phase': name,
+        'script': ' '.join([script, *args]),
+        'seconds': round(elapsed, 3),
+        'rows': rows,
+        'rows_per_sec': round(rows / elapsed) if rows else None,
+        'peak_rss_mib': round(peak_rss / 1048576, 1) if peak_rss else None,
+        'returncode': process.returncode,
+        'last_line': lines[-1] if lines else '',
+    }
+    if process.returncode != 0 or any('[ERROR]' in line or '[FATAL ERROR]' in line for line in lines):
+        record['output'] = output
+    return record
+
+def measure_interval_memory(db_path):
+    """
+    Returns the bytes per breakdown of breakdown_intervals loaded as an IntervalStore and as
+    per-machine tuples of Python values (how the Python engine used to hold them), from tracemalloc.
+    """
+    def traced(load):
+        tracemalloc.start()
+        loaded = load()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return loaded, size
+
+    sql = '''SELECT EQUIPMENT, START_TS, FINISH_TS, DOWNTIME FROM breakdown_intervals
+             ORDER BY EQUIPMENT, START_TS, NOTIFICATION'''
+    with sqlite3.connect(db_path) as db:
+        store, store_bytes = traced(lambda: IntervalStore.load(db.cursor()))
+        _, tuple_bytes = traced(lambda: [tuple(zip(*rows))[1:] for _, rows in groupby(db.execute(sql), itemgetter(0))])
+    breakdowns = len(store)
+    return {
+        'breakdowns': breakdowns,
+        'array_bytes_per_breakdown': round(store_bytes / breakdowns, 1) if breakdowns else None,
+        'tuple_bytes_per_breakdown': round(tuple_bytes / breakdowns, 1) if breakdowns else None,
+    }
+
+def closed_quarter_kpis(db_path):
+    """Returns the quarterly_kpi and quarterly_rollup rows of the closed quarters (the open one moves with the clock)."""
+    now = datetime.now()
+    current = now.year * 10 + (now.month + 2) // 3
+    with sqlite3.connect(db_path) as db:
+        kpis = db.execute('''SELECT * FROM quarterly_kpi WHERE YEAR * 10 + QUARTER < ?
+                             ORDER BY EQUIPMENT, YEAR, QUARTER''', (current,)).fetchall()
+        rollups = db.execute('''SELECT * FROM quarterly_rollup WHERE YEAR * 10 + QUARTER < ?
+                                ORDER BY LEVEL, NAME, YEAR, QUARTER''', (current,)).fetchall()
+    return kpis + rollups
+
+def print_phase(record):
+    """Prints one run_phase record as a line of the progress table, and its output if it failed."""
+    rss = f"{record['peak_rss_mib']:8.1f} MiB" if record['peak_rss_mib'] else '       - MiB'
+    rate = f"{record['rows_per_sec']:10d} rows/sec" if record['rows_per_sec'] else ' ' * 19
+    print(f"{record['phase']:<28} {record['seconds']:8.2f} s {rate} {rss}  {record['last_line']}")
+    if 'output' in record:
+        print(record['output'])
+
+def print_comparison(results, baseline):
+    """Prints each phase's time against the same phase of an earlier report."""
+    previous = {phase['phase']: phase for phase in baseline['phases']}
+    print(f"\n{'phase':<28} {'before s':>10} {'after s':>10} {'change':>8}")
+    for phase in results['phases']:
+        before = previous.get(phase['phase'])
+        if not before or not before['seconds']:
+            continue
+        change = (phase['seconds'] - before['seconds']) / before['seconds'] * 100
+        print(f"{phase['phase']:<28} {before['seconds']:10.2f} {phase['seconds']:10.2f} {change:+7.1f}%")
+
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the maintenance.db scripts on synthetic data.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small',
+                        help='Preset number of machines and notifications (default small).')
+    parser.add_argument('--machines', type=int, help='Number of machines (overrides --scale).')
+    parser.add_argument('--reports', type=int, help='Number of notifications (overrides --scale).')
+    parser.add_argument('--workers', type=int, default=1, help='--workers passed to the KPI scripts.')
+    parser.add_argument('--backend', choices=['auto', 'python', 'numpy'], default='auto',
+                        help='--backend passed to the KPI scripts.')
+    parser.add_argument('--bulk', action='store_true', help='Import the reports with reportUpdate.py --bulk.')
+    parser.add_argument('--workdir', help='Directory for the CSVs and the database (default: a temp dir).')
+    parser.add_argument('--json', help='Write the report to this JSON file.')
+    parser.add_argument('--compare', help='Earlier JSON report to compare the phase times with.')
+    args = parser.parse_args()
+
+    machines, reports = SCALES[args.scale]
+    machines = args.machines or machines
+    reports = args.reports or reports
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='benchSuite-')
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, 'maintenance.db')
+    machines_csv = os.path.join(workdir, 'machine list.csv')
+    reports_csv = os.path.join(workdir, 'reports.csv')
+    edited_csv = os.path.join(workdir, 'reports_edited.csv')
+    added_machines_csv = os.path.join(workdir, 'machine list added.csv')
+    new_machine_csv = os.path.join(workdir, 'reports_new_machine.csv')
+
+    print(f"Generating {machines} machines and {reports} notifications in {workdir}")
+    start = time.perf_counter()
+    write_machine_list(machines_csv, machines)
+    write_csv(reports_csv, synthetic_report_rows(reports, machines))
+    write_csv(edited_csv, edited_rows(reports_csv, 0.01))
+    write_machine_list(added_machines_csv, machines + 1)
+    write_csv(new_machine_csv, new_machine_rows(machines))
+    create_database(db_path, machines)
+    generate_seconds = time.perf_counter() - start
+
+    kpi_args = ['--workers', str(args.workers), '--backend', args.backend]
+    import_args = ['--bulk'] if args.bulk else []
+    phases = [
+        ('machineUpdate', 'machineUpdate.py', ['--db', db_path, '--csv', machines_csv], machines),
+        ('reportUpdate initial', 'reportUpdate.py', ['--db', db_path, '--csv', reports_csv, *import_args], reports),
+        ('createTable', 'createTable.py', [], None),
+        ('mbtrMachineUpdate', 'mbtrMachineUpdate.py', [], machines),
+        ('mtbrQuarter full', 'mtbrQuarter.py', kpi_args, reports),
+        ('mtbr', 'mtbr.py', kpi_args, reports),
+        ('reportUpdate 1% edited', 'reportUpdate.py', ['--db', db_path, '--csv', edited_csv, *import_args], reports),
+        ('mtbrQuarter incremental', 'mtbrQuarter.py', kpi_args, reports),
+        # A new machine: its reports are imported, and their dirty marks cleared, before
+        # mbtrMachineUpdate.py adds its quarterly rows
+        ('reportUpdate new machine', 'reportUpdate.py', ['--db', db_path, '--csv', new_machine_csv, *import_args], None),
+        ('mtbrQuarter no rows yet', 'mtbrQuarter.py', kpi_args, None),
+        ('machineUpdate added', 'machineUpdate.py', ['--db', db_path, '--csv', added_machines_csv], machines + 1),
+        ('mbtrMachineUpdate added', 'mbtrMachineUpdate.py', [], machines + 1),
+        ('mtbrQuarter new machine', 'mtbrQuarter.py', kpi_args, reports),
+    ]
+
+    results = {
+        'config': {'machines': machines, 'reports': reports, 'workers': args.workers,
+                   'backend': args.backend, 'bulk': args.bulk},
+        'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                        'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'generate_seconds': round(generate_seconds, 3),
+        'phases': [],
+    }
+    for name, script, script_args, rows in phases:
+        record = run_phase(name, script, script_args, db_path, rows)
+        results['phases'].append(record)
+        print_phase(record)
+
+    # The incremental runs must leave the closed quarters exactly as a full rebuild does
+    incremental = closed_quarter_kpis(db_path)
+    record = run_phase('mtbrQuarter full check', 'mtbrQuarter.py', [*kpi_args, '--full'], db_path, reports)
+    results['phases'].append(record)
+    print_phase(record)
+    full = set(closed_quarter_kpis(db_path))
+    results['incremental_mismatches'] = len(full.symmetric_difference(incremental))
+    if results['incremental_mismatches']:
+        print(f"[ERROR] Incremental and --full differ in {results['incremental_mismatches']} closed-quarter rows.")
+    else:
+        print(f"Incremental matches --full on {len(full)} closed-quarter rows.")
+
+    results['database_mib'] = round(os.path.getsize(db_path) / 1048576, 1)
+    results['interval_memory'] = measure_interval_memory(db_path)
+    memory = results['interval_memory']
+    if memory['breakdowns']:
+        print(f"Interval store: {memory['array_bytes_per_breakdown']} bytes per breakdown in arrays, "
+              f"{memory['tuple_bytes_per_breakdown']} as Python tuples ({memory['breakdowns']} breakdowns)")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if results['incremental_mismatches']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
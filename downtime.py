@@ -0,0 +1,80 @@
+"""
+Answers "what was down" questions from the breakdown intervals' R*Tree (see maintenance/downtime.py).
+
+    python downtime.py --at "03/14/2024 14:00:00" --level DEPARTMENT --name PRESS
+    python downtime.py --from "03/01/2024 00:00:00" --to "04/01/2024 00:00:00" --peak --level WORK_CENTER
+    python downtime.py --from "03/14/2024 00:00:00" --to "03/15/2024 00:00:00" --curve --name PRESS
+
+Times are 'MM/DD/YYYY HH:MM:SS', like the report exports.
+"""
+import argparse
+import sqlite3
+from datetime import timedelta
+
+from maintenance import connect, epoch_seconds, parse_datetime
+from maintenance.downtime import concurrent_downtime, down_at, has_downtime_index, overlapping
+from maintenance.kpi import ROLLUP_LEVELS
+from maintenance.periods import DATETIME_FORMAT, EPOCH
+
+
+def timestamp(text):
+    """argparse type: a 'MM/DD/YYYY HH:MM:SS' string as START_TS seconds."""
+    dt = parse_datetime(text)
+    if dt is None:
+        raise argparse.ArgumentTypeError(f"'{text}' is not MM/DD/YYYY HH:MM:SS")
+    return epoch_seconds(dt)
+
+def format_ts(ts):
+    """START_TS seconds back to 'MM/DD/YYYY HH:MM:SS'."""
+    return (EPOCH + timedelta(seconds=ts)).strftime(DATETIME_FORMAT)
+
+
+# --- Main Execution ---
+parser = argparse.ArgumentParser(description='List the machines down at a time or in a range, or the peak '
+                                             'number of machines down at once per group.')
+parser.add_argument('--at', type=timestamp, metavar='DATETIME', help='List the breakdowns ongoing at this time.')
+parser.add_argument('--from', dest='start', type=timestamp, metavar='DATETIME',
+                    help='Start of the range (with --to): list the breakdowns overlapping it.')
+parser.add_argument('--to', dest='end', type=timestamp, metavar='DATETIME', help='End of the range, not included.')
+parser.add_argument('--level', choices=ROLLUP_LEVELS, default=None,
+                    help='Group machines by this column of the machines table (default DEPARTMENT for --peak/--curve).')
+parser.add_argument('--name', default=None, help='Only machines whose --level column is NAME.')
+parser.add_argument('--peak', action='store_true', help='Per group: the most machines down at once in the range, and when.')
+parser.add_argument('--curve', action='store_true', help='Per group: every change in the number of machines down.')
+args = parser.parse_args()
+
+if (args.at is None) == (args.start is None or args.end is None):
+    parser.error('give either --at, or --from and --to')
+if (args.peak or args.curve) and args.at is not None:
+    parser.error('--peak and --curve need --from and --to')
+if args.name is not None and args.level is None and not (args.peak or args.curve):
+    parser.error('--name needs --level')
+if args.start is not None and args.start >= args.end:
+    parser.error('--from must be before --to')
+
+try:
+    with connect(readonly=True) as db:
+        cursor = db.cursor()
+        if not has_downtime_index(cursor):
+            print("[WARNING] breakdown_rtree is missing (run reportUpdate.py or migrateDb.py); scanning breakdown_intervals.")
+
+        if args.peak or args.curve:
+            curves = concurrent_downtime(cursor, args.start, args.end, args.level or 'DEPARTMENT', args.name)
+            for group, (peak, peak_ts, curve) in sorted(curves.items(), key=lambda item: str(item[0])):
+                print(f"{group}: at most {peak} machines down at once, first at {format_ts(peak_ts)}")
+                if args.curve:
+                    for ts, down in curve:
+                        print(f"  {format_ts(ts)}  {down}")
+            print(f"{len(curves)} groups with downtime.")
+        else:
+            if args.at is not None:
+                rows = down_at(cursor, args.at, args.level, args.name)
+            else:
+                rows = overlapping(cursor, args.start, args.end, args.level, args.name)
+            print(f"{'EQUIPMENT':>12} {'NOTIFICATION':>14}  {'DOWN FROM':<19}  {'DOWN UNTIL':<19}")
+            for equipment, notification, down_from, down_until in rows:
+                print(f"{equipment!s:>12} {notification:>14}  {format_ts(down_from)}  {format_ts(down_until)}")
+            print(f"{len(rows)} breakdowns, {len({row[0] for row in rows})} machines.")
+
+except sqlite3.Error as e:
+    print(f"[ERROR] Database error: {e}")
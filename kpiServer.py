@@ -0,0 +1,158 @@
+import argparse
+import json
+import sqlite3
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from maintenance import get_db_path
+from maintenance.kpi import ROLLUP_LEVELS
+from maintenance.query import (
+    CACHE_SIZE,
+    POOL_SIZE,
+    KpiQueries,
+    machine_kpis,
+    machine_quarters,
+    quarter_kpis,
+    quarterly_rollups,
+    rollups,
+)
+
+# --- Configuration ---
+# The database path comes from MAINTENANCE_DB / maintenance.ini (see maintenance/db.py).
+# Only listens on this machine by default; use --host 0.0.0.0 to serve the network.
+HOST = '127.0.0.1'
+PORT = 8080
+
+ENDPOINTS = {
+    '/status': 'generation and cache statistics',
+    '/machines/<equipment>': 'kpi row of one machine',
+    '/machines/<equipment>/quarters': 'quarterly KPIs of one machine',
+    '/quarters/<year>/<quarter>': 'KPIs of every machine for one quarter',
+    '/rollups/<level>?name=&period=': 'kpi_rollup rows (level PLANT, DEPARTMENT or WORK_CENTER)',
+    '/rollups/<level>/quarters?name=&year=': 'quarterly_rollup rows',
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def integer(value, what):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f'{what} must be an integer, got {value!r}') from None
+
+def group_name(value):
+    """NAME holds PLANT / WORK_CENTER numbers as integers and DEPARTMENT as text."""
+    if value is None:
+        return None
+    return int(value) if value.lstrip('-').isdigit() else value
+
+
+# --- Helper Function: Routing ---
+def route(queries, path, params):
+    """Returns (status, answer) for a GET of path with the query string params."""
+    parts = [part for part in path.split('/') if part]
+    first = lambda name: params.get(name, [None])[0]
+
+    if parts == ['status']:
+        return 200, queries.status()
+    if parts == []:
+        return 200, {'endpoints': ENDPOINTS}
+
+    if parts[0] == 'machines' and len(parts) in (2, 3):
+        equipment = integer(parts[1], 'equipment')
+        if len(parts) == 2:
+            answer = queries.answer(machine_kpis, equipment)
+            return (200, answer) if answer else (404, {'error': f'machine {equipment} has no KPIs'})
+        if parts[2] == 'quarters':
+            return 200, queries.answer(machine_quarters, equipment)
+
+    if parts[0] == 'quarters' and len(parts) == 3:
+        year, quarter = integer(parts[1], 'year'), integer(parts[2], 'quarter')
+        if not 1 <= quarter <= 4:
+            raise BadRequest('quarter must be 1 to 4')
+        return 200, queries.answer(quarter_kpis, year, quarter)
+
+    if parts[0] == 'rollups' and len(parts) in (2, 3):
+        level = parts[1].upper()
+        if level not in ROLLUP_LEVELS:
+            raise BadRequest(f"level must be one of {', '.join(ROLLUP_LEVELS)}")
+        name = group_name(first('name'))
+        if len(parts) == 2:
+            period = first('period')
+            return 200, queries.answer(rollups, level, name, period.upper() if period else None)
+        if parts[2] == 'quarters':
+            year = first('year')
+            return 200, queries.answer(quarterly_rollups, level, name, integer(year, 'year') if year else None)
+
+    return 404, {'error': f'unknown endpoint {path}', 'endpoints': ENDPOINTS}
+
+
+class KpiHandler(BaseHTTPRequestHandler):
+    """Answers GET requests with JSON from the server's KpiQueries."""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            status, answer = route(self.server.queries, url.path, parse_qs(url.query))
+        except BadRequest as e:
+            status, answer = 400, {'error': str(e)}
+        except sqlite3.Error as e:
+            print(f"[ERROR] A database error occurred: {e}")
+            status, answer = 500, {'error': f'database error: {e}'}
+
+        body = json.dumps(answer).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description='Serve the KPI tables as read-only JSON over HTTP.')
+    parser.add_argument('--host', default=HOST, help=f'Address to listen on (default {HOST}).')
+    parser.add_argument('--port', type=int, default=PORT, help=f'Port to listen on (default {PORT}).')
+    parser.add_argument('--pool', type=int, default=POOL_SIZE,
+                        help=f'Read-only connections shared by the request threads (default {POOL_SIZE}).')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help=f'Answers kept in the LRU cache (default {CACHE_SIZE}).')
+    parser.add_argument('--quiet', action='store_true', help='Do not log every request.')
+    args = parser.parse_args()
+    if args.pool < 1:
+        parser.error('--pool must be at least 1')
+
+    try:
+        server = ThreadingHTTPServer((args.host, args.port), KpiHandler)
+    except OSError as e:
+        # e.g. the port is already in use
+        print(f"\n[FATAL ERROR] Could not listen on {args.host}:{args.port}: {e}")
+        sys.exit(1)
+
+    queries = None
+    try:
+        server.queries = queries = KpiQueries(pool_size=args.pool, cache_size=args.cache_size)
+        server.quiet = args.quiet
+        print(f"Serving KPIs from {get_db_path()} on http://{args.host}:{server.server_port}/ (Ctrl+C to stop)")
+        server.serve_forever()
+    except sqlite3.Error as e:
+        print(f"\n[ERROR] A database error occurred: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        if queries is not None:
+            queries.pool.close()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
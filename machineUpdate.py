@@ -1,17 +1,50 @@
 #!/usr/bin/env python3
 
+import argparse
 import sqlite3
 import csv
+import sys
 
-# Surface Pro - Use raw string (r'...') for clean Windows paths
-db = sqlite3.connect(r'C:\Projects\Musashi\maintenance.db')
+from maintenance import connect
+from maintenance.manifest import plan_import, record_import
+
+# Surface Pro - Use raw string (r'...') for clean Windows paths.
+# The database path comes from MAINTENANCE_DB / maintenance.ini (see maintenance/db.py).
+CSV_PATH = r'C:\Projects\Musashi\machine list.csv'
+
+parser = argparse.ArgumentParser(description='Import the machine list export into the machines table.')
+parser.add_argument('--csv', default=CSV_PATH, help='Path of the machine list CSV export.')
+parser.add_argument('--db', help='Path of maintenance.db (default: MAINTENANCE_DB / maintenance.ini).')
+parser.add_argument('--insert-only', action='store_true',
+                    help='Only add new machines; leave changed DESCRIPTION/DEPARTMENT/WORK_CENTER values alone.')
+parser.add_argument('--force', action='store_true', help='Import the file even if ingest_manifest shows it unchanged.')
+args = parser.parse_args()
+
+db = connect(args.db)
 
 # Get a cursor object
 cursor = db.cursor()
 
-# Counters to see what equipment was added/ignored
-count_ignore = 0
+# The machine list is always read in full, but not at all when it is the same export as last time
+try:
+    action, _, fingerprint = plan_import(cursor, args.csv, 'machines')
+except FileNotFoundError as e:
+    print(f"[ERROR] CSV file not found at path: {e.filename or args.csv}")
+    db.close()
+    sys.exit(1)
+if action in ('unchanged', 'touched') and not args.force:
+    if action == 'touched':
+        record_import(cursor, args.csv, 'machines', fingerprint, 0, append=True)
+        db.commit()
+    print(f'{args.csv}: unchanged since its last import, skipped.')
+    db.close()
+    sys.exit(0)
+
+# Counters to see what equipment was added/updated/ignored/errored
 count_add = 0
+count_update = 0
+count_ignore = 0
+count_error = 0
 
 # The table creation you showed:
 # CREATE TABLE machines(EQUIPMENT integer PRIMARY KEY, DESCRIPTION text, PLANT integer, DEPARTMENT text, WORK_CENTER integer)
@@ -19,34 +52,77 @@ count_add = 0
 # Equipment[0], Description[1], Location[2], Cost Center[3], Plant[4]
 
 # Assuming Cost Center [3] is WORK_CENTER and Location [2] is DEPARTMENT
-with open(r'C:\Projects\Musashi\machine list.csv') as f:
+machine_rows = []
+with open(args.csv) as f:
     csvreader = csv.reader(f)
     next(csvreader) # Skip the header row
-    
-    # Use INSERT OR IGNORE to handle duplicates directly in SQL
-    sql_insert = '''INSERT OR IGNORE INTO machines(EQUIPMENT, DESCRIPTION, PLANT, DEPARTMENT, WORK_CENTER) 
-                    VALUES(?,?,?,?,?)'''
-    
+
     for row in csvreader:
         try:
             # Assuming row[3] is WORK_CENTER
             # Mapped: [0]EQUIPMENT, [1]DESCRIPTION, [4]PLANT, [2]DEPARTMENT, [3]WORK_CENTER
-            cursor.execute(sql_insert, (row[0], row[1], row[4], row[2], row[3]))
-            
-            # Check if a row was actually inserted (optional but robust)
-            if cursor.rowcount > 0:
-                count_add += 1
-            else:
-                count_ignore += 1
-                
-        # Catch any other potential SQLite errors, but not IntegrityError if using INSERT OR IGNORE
-        except sqlite3.Error as e:
-            print(f"Error processing row {row[0]}: {e}")
-            count_ignore += 1 
-
-db.commit()
+            machine_rows.append((row[0], row[1], row[4], row[2], row[3]))
+        except IndexError:
+            print(f"Error processing row {row[0] if row else row}: expected 5 columns, got {len(row)}")
+            count_error += 1
+
+try:
+    # 1. Load the whole file with one executemany into a staging table that has the
+    #    same column affinities as machines, so '10000123' becomes 10000123 there too
+    cursor.execute('DROP TABLE IF EXISTS temp.machines_staging')
+    cursor.execute('''CREATE TEMP TABLE machines_staging AS
+                      SELECT EQUIPMENT, DESCRIPTION, PLANT, DEPARTMENT, WORK_CENTER FROM machines WHERE 0''')
+    cursor.executemany('''INSERT INTO machines_staging(EQUIPMENT, DESCRIPTION, PLANT, DEPARTMENT, WORK_CENTER)
+                          VALUES(?,?,?,?,?)''', machine_rows)
+
+    # 2. EQUIPMENT is the rowid of machines, so anything that is not an integer would fail
+    cursor.execute("SELECT EQUIPMENT FROM machines_staging WHERE typeof(EQUIPMENT) != 'integer'")
+    invalid_rows = cursor.fetchall()
+    for (equipment,) in invalid_rows:
+        print(f"Error processing row {equipment}: EQUIPMENT is not an integer")
+    count_error += len(invalid_rows)
+    cursor.execute("DELETE FROM machines_staging WHERE typeof(EQUIPMENT) != 'integer'")
+
+    # 3. A machine listed twice keeps its first row, like INSERT OR IGNORE did
+    cursor.execute('''DELETE FROM machines_staging WHERE rowid NOT IN
+                      (SELECT MIN(rowid) FROM machines_staging GROUP BY EQUIPMENT)''')
+
+    # 4. Diff against the existing EQUIPMENT keys to know how many rows are new
+    cursor.execute('''SELECT COUNT(*) FROM machines_staging s
+                      WHERE NOT EXISTS (SELECT 1 FROM machines m WHERE m.EQUIPMENT = s.EQUIPMENT)''')
+    count_add = cursor.fetchone()[0]
+
+    # 5. Insert new machines and update changed ones in the same statement.
+    #    "WHERE true" is required by SQLite to tell the upsert clause apart from a join.
+    if args.insert_only:
+        conflict = 'DO NOTHING'
+    else:
+        conflict = '''DO UPDATE SET DESCRIPTION = excluded.DESCRIPTION, DEPARTMENT = excluded.DEPARTMENT,
+                      WORK_CENTER = excluded.WORK_CENTER
+                      WHERE machines.DESCRIPTION IS NOT excluded.DESCRIPTION
+                         OR machines.DEPARTMENT IS NOT excluded.DEPARTMENT
+                         OR machines.WORK_CENTER IS NOT excluded.WORK_CENTER'''
+    cursor.execute(f'''INSERT INTO machines(EQUIPMENT, DESCRIPTION, PLANT, DEPARTMENT, WORK_CENTER)
+                       SELECT EQUIPMENT, DESCRIPTION, PLANT, DEPARTMENT, WORK_CENTER FROM machines_staging WHERE true
+                       ON CONFLICT(EQUIPMENT) {conflict}''')
+    count_update = cursor.rowcount - count_add
+    count_ignore = len(machine_rows) - len(invalid_rows) - count_add - count_update
+
+    cursor.execute('DROP TABLE temp.machines_staging')
+    # Committed with the machines, so a failed import is tried again next time
+    record_import(cursor, args.csv, 'machines', fingerprint, len(machine_rows))
+    db.commit()
+
+# Catch any other potential SQLite errors
+except sqlite3.Error as e:
+    print(f"Database error, no machines were imported: {e}")
+    db.rollback()
+    db.close()
+    sys.exit(1)
 
 print(f'{count_add} machines were added.')
-print(f'{count_ignore} machines were ignored (already existed or had an error).')
+print(f'{count_update} machines were updated (changed description, department or work center).')
+print(f'{count_ignore} machines were ignored (already existed unchanged or listed twice).')
+print(f'{count_error} machines had an error.')
 
 db.close()
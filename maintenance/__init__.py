@@ -0,0 +1,24 @@
+"""
+Shared core of the maintenance.db scripts: the connection factory, the period and
+quarter helpers, and the schema objects several scripts create.
+"""
+from .db import DEFAULT_DB_PATH, connect, get_db_path
+from .periods import (
+    EPOCH,
+    epoch_seconds,
+    generate_quarter_tables,
+    generate_quarters,
+    get_quarter,
+    hours_between,
+    hundredths,
+    month_period,
+    parse_datetime,
+    quarter_periods,
+    quarter_table_name,
+    report_timestamps,
+    start_ts_range,
+    time_difference,
+    to_epoch,
+    trailing_period,
+    year_periods,
+)
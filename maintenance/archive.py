@@ -0,0 +1,171 @@
+"""
+Per-year archive databases for the reports of closed years.
+
+archiveReports.py moves a closed year's reports out of maintenance.db into
+maintenance_<year>.db next to it and records the year in report_archives (see
+schema.ensure_report_archives), so the main file, its reports index and its backups
+stop growing with history. breakdown_intervals, and the R*Tree built on it, keep every
+year: the KPI engines and downtime.py never need an archive.
+
+What does read archived reports, the per-machine reference queries of --verify and
+ad-hoc queries, calls attach_archives with its time window. It attaches, read-only,
+only the archives the window reaches, and shadows reports with a TEMP view of
+main.reports UNION ALL the attached ones, so queries on reports work unchanged on that
+connection. A window that reaches no archived year attaches nothing. The view is TEMP
+because views stored in maintenance.db cannot refer to attached databases.
+"""
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from .db import get_db_path
+from .periods import epoch_seconds, start_ts_range
+from .schema import REPORTS_INDEX, ensure_breakdown_intervals, ensure_report_archives
+
+# Schema name of the archive attached by archive_year
+_MOVE_SCHEMA = 'archive'
+
+
+def year_range(year):
+    """
+    Returns the [start, end) START_TS range of a calendar year.
+
+    >>> year_range(1970)
+    (0, 31536000)
+    """
+    return epoch_seconds(datetime(year, 1, 1)), epoch_seconds(datetime(year + 1, 1, 1))
+
+def archive_path(year, db_path=None):
+    """Returns the archive database of year: maintenance_2016.db next to maintenance.db."""
+    db_path = Path(db_path or get_db_path())
+    return db_path.with_name(f'{db_path.stem}_{year}{db_path.suffix}')
+
+def window_ts_range(windows):
+    """
+    Returns the [low, high) START_TS range (start, end) windows reach, in whole days like start_ts_range.
+
+    low is None when a window is all time (start None); no windows reach (0, 0).
+
+    >>> window_ts_range([(datetime(1970, 1, 2), datetime(1970, 1, 2, 8)), (datetime(1970, 1, 3), datetime(1970, 1, 4))])
+    (86400, 345600)
+    >>> window_ts_range([(None, datetime(1970, 1, 1)), (datetime(1970, 1, 2), datetime(1970, 1, 2))])
+    (None, 172800)
+    """
+    if not windows:
+        return 0, 0
+    starts = [start for start, _ in windows]
+    low = None if None in starts else start_ts_range(min(starts), min(starts))[0]
+    return low, start_ts_range(max(end for _, end in windows), max(end for _, end in windows))[1]
+
+
+def archived_years(cursor):
+    """Returns the report_archives rows (YEAR, PATH, START_TS, END_TS) in year order, [] if none."""
+    try:
+        cursor.execute("SELECT YEAR, PATH, START_TS, END_TS FROM report_archives ORDER BY YEAR")
+    except sqlite3.OperationalError:
+        return []  # never archived (or a read-only connection to a database without the table)
+    return cursor.fetchall()
+
+def attach_archives(cursor, start_ts=None, end_ts=None, db_path=None):
+    """
+    Attaches the archives of the years [start_ts, end_ts) reaches and returns those years.
+
+    start_ts / end_ts: START_TS bounds of the window, None for open-ended. The archives are
+    attached read-only as archive_<year>, and a TEMP view named reports makes queries on
+    reports read main.reports UNION ALL the attached years. Returns [] without attaching
+    anything when the window reaches no archived year. Must be called outside a
+    transaction; detach_archives undoes it.
+    db_path: maintenance.db, whose directory holds the archives; defaults to get_db_path().
+    """
+    years = [(year, path) for year, path, year_start, year_end in archived_years(cursor)
+             if (start_ts is None or year_end > start_ts) and (end_ts is None or year_start < end_ts)]
+    if not years:
+        return []
+
+    cursor.execute("SELECT COUNT(*) FROM pragma_database_list WHERE name NOT IN ('main', 'temp')")
+    limit = cursor.connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if cursor.fetchone()[0] + len(years) > limit:
+        raise sqlite3.OperationalError(f'the window reaches {len(years)} archived years, but SQLite can only attach '
+                                       f'{limit} databases; narrow the window')
+
+    directory = Path(db_path or get_db_path()).absolute().parent
+    for year, path in years:
+        cursor.execute(f'ATTACH DATABASE ? AS archive_{year}', (f'{(directory / path).as_uri()}?mode=ro',))
+    arms = ' UNION ALL '.join(['SELECT * FROM main.reports'] + [f'SELECT * FROM archive_{year}.reports' for year, _ in years])
+    cursor.execute('DROP VIEW IF EXISTS temp.reports')
+    cursor.execute(f'CREATE TEMP VIEW reports AS {arms}')
+    return [year for year, _ in years]
+
+def detach_archives(cursor, years):
+    """Drops the reports view and detaches the archives attach_archives returned."""
+    if not years:
+        return
+    cursor.execute('DROP VIEW IF EXISTS temp.reports')
+    for year in years:
+        cursor.execute(f'DETACH DATABASE archive_{year}')
+
+
+def archive_year(cursor, year, db_path=None):
+    """
+    Moves the reports of year from maintenance.db into its archive database; returns the rows moved.
+
+    cursor: of a connection opened with isolation_level=None, outside a transaction.
+    The rows are first copied into the archive and committed there, then deleted from
+    maintenance.db together with the report_archives row. The reports DELETE triggers
+    are suspended for the delete, so breakdown_intervals keeps the year and no quarter
+    is marked dirty. If the second step fails the rows are in both files; running it
+    again finishes the move (the archive ignores rows it already has).
+    """
+    db_path = db_path or get_db_path()
+    ensure_report_archives(cursor)
+    # The intervals keep the year, so they must hold it before its reports leave
+    ensure_breakdown_intervals(cursor)
+    start_ts, end_ts = year_range(year)
+    path = archive_path(year, db_path)
+
+    cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'reports'")
+    reports_sql = cursor.fetchone()[0]
+    cursor.execute("SELECT name, sql FROM main.sqlite_master WHERE type = 'trigger' AND tbl_name = 'reports'")
+    delete_triggers = [(name, sql) for name, sql in cursor.fetchall() if re.search(r'\bDELETE\s+ON\b', sql, re.I)]
+
+    cursor.execute(f'ATTACH DATABASE ? AS {_MOVE_SCHEMA}', (str(path),))
+    try:
+        # Same definition as reports (including the columns migrateDb.py added), and its index
+        cursor.execute('BEGIN')
+        cursor.execute(re.sub(r'^CREATE TABLE\s+("?)reports\1', f'CREATE TABLE IF NOT EXISTS {_MOVE_SCHEMA}.reports',
+                              reports_sql, flags=re.I))
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {_MOVE_SCHEMA}.{REPORTS_INDEX} ON reports(EQUIPMENT, BREAKDOWN, START_TS)')
+        cursor.execute(f'''INSERT OR IGNORE INTO {_MOVE_SCHEMA}.reports SELECT * FROM main.reports
+                           WHERE START_TS >= ? AND START_TS < ? ORDER BY NOTIFICATION''', (start_ts, end_ts))
+        cursor.execute('COMMIT')
+
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(f'''SELECT COUNT(*) FROM main.reports m WHERE START_TS >= ? AND START_TS < ?
+                           AND NOT EXISTS (SELECT 1 FROM {_MOVE_SCHEMA}.reports a WHERE a.NOTIFICATION = m.NOTIFICATION)''',
+                       (start_ts, end_ts))
+        missing = cursor.fetchone()[0]
+        if missing:
+            raise sqlite3.IntegrityError(f'{missing} reports of {year} are not in {path.name}; nothing was deleted')
+
+        for name, _ in delete_triggers:
+            cursor.execute(f'DROP TRIGGER {name}')
+        cursor.execute('DELETE FROM main.reports WHERE START_TS >= ? AND START_TS < ?', (start_ts, end_ts))
+        moved = cursor.rowcount
+        for _, sql in delete_triggers:
+            cursor.execute(sql)
+
+        cursor.execute(f'SELECT COUNT(*) FROM {_MOVE_SCHEMA}.reports')
+        cursor.execute('''
+            INSERT INTO report_archives(YEAR, PATH, START_TS, END_TS, ROWS, ARCHIVED)
+            VALUES (?, ?, ?, ?, ?, datetime('now', 'localtime'))
+            ON CONFLICT(YEAR) DO UPDATE SET PATH = excluded.PATH, ROWS = excluded.ROWS, ARCHIVED = excluded.ARCHIVED
+        ''', (year, path.name, start_ts, end_ts, cursor.fetchone()[0]))
+        cursor.execute('COMMIT')
+    except BaseException:
+        if cursor.connection.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.execute(f'DETACH DATABASE {_MOVE_SCHEMA}')
+    return moved
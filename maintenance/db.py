@@ -0,0 +1,69 @@
+"""
+Connection factory for maintenance.db.
+
+Every script opens the database through connect(), so the file location and the
+SQLite tuning live in one place. The path is taken from, in order:
+
+1. the MAINTENANCE_DB environment variable,
+2. [database] path in a maintenance.ini next to the scripts (or MAINTENANCE_CONFIG),
+3. DEFAULT_DB_PATH below.
+"""
+import configparser
+import os
+import sqlite3
+from pathlib import Path
+
+# Surface Pro. The work laptop uses H:\Projects\maintenance.db (set MAINTENANCE_DB there).
+DEFAULT_DB_PATH = r'C:\Projects\Musashi\maintenance.db'
+
+CONFIG_PATH = os.environ.get(
+    'MAINTENANCE_CONFIG',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'maintenance.ini'),
+)
+
+# Per-connection tuning. cache_size is negative, i.e. KiB rather than pages.
+PRAGMAS = {
+    'synchronous': 'NORMAL',        # safe with WAL, one fsync per checkpoint instead of per commit
+    'cache_size': -65536,           # 64 MiB page cache
+    'mmap_size': 268435456,         # read pages through a 256 MiB memory map
+    'temp_store': 'MEMORY',         # staging tables and sorts stay off disk
+}
+
+# Seconds to wait on a lock held by another script before failing
+BUSY_TIMEOUT = 30.0
+
+
+def get_db_path():
+    """Returns the maintenance.db path from the environment, maintenance.ini or the default."""
+    path = os.environ.get('MAINTENANCE_DB')
+    if path:
+        return path
+
+    config = configparser.ConfigParser()
+    if config.read(CONFIG_PATH) and config.has_option('database', 'path'):
+        return config.get('database', 'path')
+
+    return DEFAULT_DB_PATH
+
+
+def connect(path=None, readonly=False, **kwargs):
+    """
+    Opens maintenance.db with the shared pragmas and returns the sqlite3 connection.
+
+    path: database file, defaults to get_db_path().
+    readonly: open with mode=ro, for readers that must never take a write lock.
+    kwargs: passed on to sqlite3.connect (e.g. isolation_level=None).
+    """
+    path = path or get_db_path()
+    kwargs.setdefault('timeout', BUSY_TIMEOUT)
+
+    if readonly:
+        db = sqlite3.connect(f'{Path(path).absolute().as_uri()}?mode=ro', uri=True, **kwargs)
+    else:
+        db = sqlite3.connect(path, **kwargs)
+        # WAL lets readers keep going while a script writes; it is stored in the file
+        db.execute('PRAGMA journal_mode = WAL')
+
+    for name, value in PRAGMAS.items():
+        db.execute(f'PRAGMA {name} = {value}')
+    return db
@@ -0,0 +1,115 @@
+"""
+Point-in-time and overlap queries over the breakdown intervals, and concurrent-downtime curves.
+
+The queries search the breakdown_rtree R*Tree (see schema.ensure_downtime_index), so
+"what was down at T" costs a tree descent plus the matches rather than a scan of every
+breakdown. A machine counts as down from its START_TS up to, not including, its
+FINISH_TS; a breakdown without a finish time is never down. Times are START_TS seconds
+(see periods.epoch_seconds). Machines are grouped by the machines table, like the rollups.
+"""
+from .kpi import ROLLUP_LEVELS
+
+
+def has_downtime_index(cursor):
+    """True if breakdown_rtree exists; without it the queries scan breakdown_intervals."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'breakdown_rtree'")
+    return cursor.fetchone() is not None
+
+
+def _intervals(cursor, start_ts, end_ts, level=None, name=None):
+    """
+    Returns (EQUIPMENT, NOTIFICATION, DOWN_FROM, DOWN_UNTIL, group) for the breakdowns
+    down at some moment of [start_ts, end_ts], optionally of one group of a level.
+    """
+    if level is not None and level not in ROLLUP_LEVELS:
+        raise ValueError(f"level must be one of {', '.join(ROLLUP_LEVELS)}")
+    group = f'm.{level}' if level else 'NULL'
+    join = 'JOIN machines m ON m.EQUIPMENT = i.EQUIPMENT' if level else ''
+    where_name = f' AND m.{level} = :name' if level and name is not None else ''
+
+    if has_downtime_index(cursor):
+        # LOW / HIGH narrow the search in the tree; DOWN_FROM / DOWN_UNTIL are exact
+        source = '''SELECT EQUIPMENT, NOTIFICATION, DOWN_FROM, DOWN_UNTIL FROM breakdown_rtree
+                    WHERE LOW <= :end AND HIGH >= :start'''
+    else:
+        source = '''SELECT EQUIPMENT, NOTIFICATION, MIN(START_TS, FINISH_TS) AS DOWN_FROM,
+                           MAX(START_TS, FINISH_TS) AS DOWN_UNTIL
+                    FROM breakdown_intervals WHERE FINISH_TS IS NOT NULL'''
+    cursor.execute(f'''
+        SELECT i.EQUIPMENT, i.NOTIFICATION, i.DOWN_FROM, i.DOWN_UNTIL, {group}
+        FROM ({source}) AS i {join}
+        WHERE i.DOWN_FROM <= :end AND i.DOWN_UNTIL > :start AND i.DOWN_UNTIL > i.DOWN_FROM{where_name}
+        ORDER BY i.DOWN_FROM, i.EQUIPMENT
+    ''', {'start': start_ts, 'end': end_ts, 'name': name})
+    return cursor.fetchall()
+
+
+def down_at(cursor, ts, level=None, name=None):
+    """
+    Returns the breakdowns that had machines down at ts, as (EQUIPMENT, NOTIFICATION, DOWN_FROM, DOWN_UNTIL).
+
+    level / name: only machines whose machines.{level} is name, e.g. ('DEPARTMENT', 'PRESS').
+    """
+    return [row[:4] for row in _intervals(cursor, ts, ts, level, name)]
+
+
+def overlapping(cursor, start_ts, end_ts, level=None, name=None):
+    """Returns the breakdowns with a machine down at some moment of [start_ts, end_ts), like down_at."""
+    return [row[:4] for row in _intervals(cursor, start_ts, end_ts - 1, level, name)]
+
+
+def concurrency_curve(intervals, start_ts, end_ts):
+    """
+    Sweeps (EQUIPMENT, DOWN_FROM, DOWN_UNTIL) intervals and returns the number of machines down over time.
+
+    Overlapping breakdowns of one machine count once. Returns (peak, peak_ts, curve), with
+    curve the (ts, machines down) steps within [start_ts, end_ts), starting at start_ts.
+
+    >>> concurrency_curve([(1, 0, 10), (2, 5, 15), (1, 8, 20)], 0, 30)
+    (2, 5, [(0, 1), (5, 2), (15, 1), (20, 0)])
+    >>> concurrency_curve([(1, 0, 10), (2, 10, 15)], 0, 30)
+    (1, 0, [(0, 1), (15, 0)])
+    """
+    events = []
+    for equipment, down_from, down_until in intervals:
+        down_from, down_until = max(down_from, start_ts), min(down_until, end_ts)
+        if down_from < down_until:
+            events.append((down_from, 1, equipment))
+            events.append((down_until, -1, equipment))
+    # Ends sort before starts at the same second: [start, finish) intervals that touch do not overlap
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    open_breakdowns = {}
+    curve = [(start_ts, 0)]
+    peak, peak_ts = 0, start_ts
+    for ts, delta, equipment in events:
+        open_breakdowns[equipment] = open_breakdowns.get(equipment, 0) + delta
+        if not open_breakdowns[equipment]:
+            del open_breakdowns[equipment]
+        down = len(open_breakdowns)
+        if down == curve[-1][1]:
+            continue
+        if curve[-1][0] == ts:
+            # Several events at one second: keep the last count, and no step back to the same count
+            curve[-1] = (ts, down)
+            if len(curve) > 1 and curve[-2][1] == down:
+                curve.pop()
+        else:
+            curve.append((ts, down))
+        if down > peak:
+            peak, peak_ts = down, ts
+    return peak, peak_ts, curve
+
+
+def concurrent_downtime(cursor, start_ts, end_ts, level='DEPARTMENT', name=None):
+    """
+    Returns group -> (peak, peak_ts, curve) of concurrently down machines in [start_ts, end_ts).
+
+    level: 'PLANT', 'DEPARTMENT' or 'WORK_CENTER'; name limits it to one group.
+    Machines that are not in the machines table, or have no value for level, are left out.
+    """
+    by_group = {}
+    for equipment, _, down_from, down_until, group in _intervals(cursor, start_ts, end_ts - 1, level, name):
+        if group is not None:
+            by_group.setdefault(group, []).append((equipment, down_from, down_until))
+    return {group: concurrency_curve(intervals, start_ts, end_ts) for group, intervals in by_group.items()}
@@ -0,0 +1,200 @@
+"""
+Optional run instrumentation for the KPI and ingest scripts.
+
+A script calls start_run() with its parsed arguments (see add_arguments) and
+finish_run() at the end. With --stats, the time spent in each phase ('query',
+'parse', 'compute', 'write', ...), a few counters and every SQL statement the
+connection runs are collected and written as one JSON run summary; a path ending
+in .jsonl gets one line appended per run, for charting over time. With --profile,
+the whole run is also profiled with cProfile and the pstats are dumped to a file.
+
+Without either flag phase(), timed() and count() do nothing, so the scripts and
+the engines in maintenance/kpi.py can call them unconditionally.
+
+Phase times are exclusive: time in a nested phase is not counted in the outer
+one, so the phases add up to the run time. SQL statement times are sampled with
+the SQLite progress handler and are approximate; the counts are exact.
+"""
+import cProfile
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# SQLite virtual machine steps between two progress handler calls
+PROGRESS_STEPS = 1000
+# Number of statements listed in the summary, slowest first
+TOP_STATEMENTS = 25
+
+# The RunStats of this process's run, or None when instrumentation is off
+_run = None
+# The cProfile.Profile of this process's run, or None
+_profiler = None
+
+
+class RunStats:
+    """Phase timers, counters and SQL statement statistics of one script run."""
+
+    def __init__(self, script, argv):
+        self.script = script
+        self.argv = argv
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.statements = {}
+        self._stack = []
+        self._statement = None
+        self._tick = None
+
+    # --- Phases and counters ---
+    def enter(self, name):
+        """Starts timing a phase, pausing the phase it is nested in."""
+        now = time.perf_counter()
+        if self._stack:
+            self._add(self._stack[-1][0], now - self._stack[-1][1], 0)
+        self._stack.append([name, now])
+
+    def exit(self):
+        """Stops timing the innermost phase and resumes the one it was nested in."""
+        now = time.perf_counter()
+        name, started = self._stack.pop()
+        self._add(name, now - started, 1)
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def _add(self, name, seconds, calls):
+        phase = self.phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+        phase['seconds'] += seconds
+        phase['calls'] += calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # --- SQL statements ---
+    def trace(self, db):
+        """Counts and times the statements run on a connection, including trigger bodies."""
+        db.set_trace_callback(self._on_statement)
+        db.set_progress_handler(self._on_progress, PROGRESS_STEPS)
+
+    def _on_statement(self, sql):
+        # Bound values are expanded into the text; fold them so executemany groups together
+        sql = re.sub(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b", '?', ' '.join(sql.split()))[:300]
+        statement = self.statements.get(sql)
+        if statement is None:
+            statement = self.statements[sql] = {'sql': sql, 'count': 0, 'vm_steps': 0, 'seconds': 0.0}
+        statement['count'] += 1
+        self._statement = statement
+        self._tick = time.perf_counter()
+
+    def _on_progress(self):
+        now = time.perf_counter()
+        if self._statement is not None:
+            self._statement['vm_steps'] += PROGRESS_STEPS
+            self._statement['seconds'] += now - self._tick
+        self._tick = now
+        return 0
+
+    # --- Summary ---
+    def summary(self):
+        """Returns the run summary as a JSON-serialisable dict."""
+        statements = sorted(self.statements.values(), key=lambda s: (-s['seconds'], -s['count']))
+        seconds = time.perf_counter() - self.start
+        return {
+            'script': self.script,
+            'argv': self.argv,
+            'started': self.started.isoformat(timespec='seconds'),
+            'seconds': round(seconds, 4),
+            'phases': {name: {'seconds': round(phase['seconds'], 4), 'calls': phase['calls']}
+                       for name, phase in self.phases.items()},
+            # Time outside any phase (imports, argument parsing, printing)
+            'untimed_seconds': round(seconds - sum(phase['seconds'] for phase in self.phases.values()), 4),
+            'counters': self.counters,
+            'sql': {
+                'statements': sum(s['count'] for s in statements),
+                'distinct': len(statements),
+                'top': [dict(s, seconds=round(s['seconds'], 4)) for s in statements[:TOP_STATEMENTS]],
+            },
+        }
+
+
+# --- Module Functions Used by the Scripts ---
+def add_arguments(parser):
+    """Adds the --stats and --profile options to a script's argument parser."""
+    parser.add_argument('--stats', metavar='PATH',
+                        help='Write a JSON run summary (phase timings, counters, SQL statements) to PATH; '
+                             'a .jsonl path gets one line appended per run.')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='Profile the run with cProfile and dump the pstats to PATH.')
+
+def start_run(args, script=None):
+    """Starts instrumentation if --stats or --profile was given; returns the RunStats or None."""
+    global _run, _profiler
+    if getattr(args, 'profile', None):
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if getattr(args, 'stats', None):
+        _run = RunStats(script or os.path.basename(sys.argv[0]), sys.argv[1:])
+    return _run
+
+def trace(db):
+    """Traces the connection's SQL statements when --stats is on."""
+    if _run is not None:
+        _run.trace(db)
+
+def finish_run(args):
+    """Writes the --stats summary and the --profile dump of the run started by start_run."""
+    global _run, _profiler
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(args.profile)
+        print(f"Profile written to {args.profile} (python -m pstats {args.profile})")
+        _profiler = None
+    if _run is not None:
+        summary = _run.summary()
+        if args.stats.endswith('.jsonl'):
+            with open(args.stats, 'a') as f:
+                f.write(json.dumps(summary) + '\n')
+        else:
+            with open(args.stats, 'w') as f:
+                json.dump(summary, f, indent=2)
+        print(f"Run summary written to {args.stats}")
+        _run = None
+
+@contextmanager
+def phase(name):
+    """Times the enclosed block as phase `name` (nested phases are timed separately)."""
+    if _run is None:
+        yield
+        return
+    _run.enter(name)
+    try:
+        yield
+    finally:
+        _run.exit()
+
+def timed(iterable, name):
+    """Yields from iterable, timing each next() as phase `name`; returns it unchanged when off."""
+    if _run is None:
+        return iterable
+    return _timed(iterable, name)
+
+def _timed(iterable, name):
+    iterator = iter(iterable)
+    while True:
+        _run.enter(name)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _run.exit()
+        yield item
+
+def count(name, n=1):
+    """Adds n to counter `name`."""
+    if _run is not None:
+        _run.count(name, n)
@@ -0,0 +1,196 @@
+"""
+Compact store of the breakdown intervals for the pure-Python KPI engine.
+
+Every machine's intervals from breakdown_intervals live in a few flat typed arrays,
+sorted by machine and START_TS: array('q') START_TS and FINISH_TS and the running
+totals of downtime (array('d'), minutes) and of the gaps between failures
+(array('q'), seconds). That is 32 bytes per breakdown, against about 100 for the
+same values as tuples of Python ints (benchmarks/benchSuite.py measures both), and
+the prefix sums are built a column at a time, so the KPI loop allocates nothing per
+row. A MachineIntervals view is one machine's slice of the store; load_chunks hands
+out the table a few thousand rows at a time for engines that visit each machine once.
+"""
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, groupby, islice
+
+# Totals of a machine or period without breakdowns
+NO_FAILURES = (0, 0, 0)
+
+# FINISH_TS stored for a breakdown without a finish time
+NO_FINISH = -(1 << 63)
+
+# Rows fetched and converted to columns at a time, which bounds the row tuples held at once
+CHUNK_ROWS = 4096
+
+# Last machine of an empty store (EQUIPMENT itself may be None)
+_NO_MACHINE = object()
+
+
+class IntervalStore:
+    """
+    The breakdown intervals of many machines, in machine and start order.
+
+    >>> store = IntervalStore.from_rows([(7, 0, 3600, 60), (7, 7200, None, 30), (9, 100, 200, None)])
+    >>> len(store), store.get(7).window_totals([(None, None, None, 10800)])
+    (3, [(90.0, 3600, 2)])
+    >>> store.get(8) is None, [intervals.machine for intervals in store]
+    (True, [7, 9])
+    """
+
+    __slots__ = ('starts', 'finishes', 'cum_downtime', 'cum_gap', 'ranges')
+
+    def __init__(self):
+        self.starts = array('q')
+        self.finishes = array('q')
+        # cum_downtime[i] / cum_gap[i]: totals of the first i rows, the gaps within each machine
+        self.cum_downtime = array('d', [0.0])
+        self.cum_gap = array('q', [0])
+        # machine -> (first row, end row)
+        self.ranges = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Builds a store from (EQUIPMENT, START_TS, FINISH_TS, DOWNTIME) rows sorted by machine and start."""
+        store = cls()
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, CHUNK_ROWS))
+            if not chunk:
+                return store
+            store._extend(chunk)
+
+    def _extend(self, rows):
+        """Appends sorted rows that follow the stored ones, one column at a time."""
+        equipment, starts, finishes, downtimes = zip(*rows)
+        finishes = [NO_FINISH if finish is None else finish for finish in finishes]
+
+        # Gap from the previous row's finish to each start; a missing FINISH_TS adds no
+        # time, like an unparsable FINISH does in calculate_kpis
+        previous = self.finishes[-1] if self.finishes else NO_FINISH
+        gaps = [0 if before == NO_FINISH else abs(start - before)
+                for start, before in zip(starts, [previous, *finishes[:-1]])]
+
+        # Each machine's rows are contiguous; the first may continue the last stored machine
+        offset = row = len(self.starts)
+        last_machine = next(reversed(self.ranges), _NO_MACHINE)
+        for machine, group in groupby(equipment):
+            count = len(list(group))
+            if row == offset and machine == last_machine:
+                first = self.ranges[machine][0]
+            else:
+                first = row
+                gaps[row - offset] = 0
+            self.ranges[machine] = (first, row + count)
+            row += count
+
+        # fromlist is the fast path of array; the running totals continue the stored ones
+        self.starts.fromlist(list(starts))
+        self.finishes.fromlist(finishes)
+        self.cum_downtime.fromlist(list(accumulate([downtime or 0 for downtime in downtimes],
+                                                   initial=self.cum_downtime[-1]))[1:])
+        self.cum_gap.fromlist(list(accumulate(gaps, initial=self.cum_gap[-1]))[1:])
+
+    @classmethod
+    def load(cls, cursor, equipment_range=None):
+        """
+        Reads breakdown_intervals in primary key order into a new store.
+
+        No date string is parsed. equipment_range: optional (first, last) EQUIPMENT to read.
+        """
+        _select_intervals(cursor, equipment_range)
+        return cls.from_rows(cursor)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        for machine, (first, end) in self.ranges.items():
+            yield MachineIntervals(self, machine, first, end)
+
+    def get(self, machine):
+        """Returns the MachineIntervals of machine, or None when it has no breakdowns."""
+        bounds = self.ranges.get(machine)
+        return MachineIntervals(self, machine, *bounds) if bounds else None
+
+    def nbytes(self):
+        """Bytes held by the arrays (the per-machine ranges not included)."""
+        return sum(column.itemsize * column.buffer_info()[1]
+                   for column in (self.starts, self.finishes, self.cum_downtime, self.cum_gap))
+
+
+def _select_intervals(cursor, equipment_range):
+    sql_range = 'WHERE EQUIPMENT BETWEEN ? AND ?' if equipment_range else ''
+    cursor.execute(f'''
+        SELECT EQUIPMENT, START_TS, FINISH_TS, DOWNTIME
+        FROM breakdown_intervals {sql_range}
+        ORDER BY EQUIPMENT, START_TS, NOTIFICATION
+    ''', tuple(equipment_range or ()))
+
+def load_chunks(cursor, equipment_range=None, chunk_rows=CHUNK_ROWS):
+    """
+    Yields breakdown_intervals as IntervalStores of about chunk_rows rows, each machine whole in one.
+
+    For engines that visit every machine once: only one chunk is held at a time.
+    equipment_range: optional (first, last) EQUIPMENT to read.
+    """
+    _select_intervals(cursor, equipment_range)
+    rows = []
+    while True:
+        fetched = cursor.fetchmany(chunk_rows)
+        if not fetched:
+            if rows:
+                yield IntervalStore.from_rows(rows)
+            return
+        rows.extend(fetched)
+        # The last machine may go on in the next fetch; it is kept for the next chunk
+        split = len(rows)
+        while split and rows[split - 1][0] == rows[-1][0]:
+            split -= 1
+        if split:
+            yield IntervalStore.from_rows(rows[:split])
+            rows = rows[split:]
+
+
+class MachineIntervals:
+    """One machine's rows of an IntervalStore: rows first to end - 1."""
+
+    __slots__ = ('store', 'machine', 'first', 'end')
+
+    def __init__(self, store, machine, first, end):
+        self.store = store
+        self.machine = machine
+        self.first = first
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.first
+
+    def window_totals(self, bounds):
+        """
+        Returns the (downtime minutes, operational seconds, COUNT) for each kpi.period_bounds() window.
+
+        Each window is two binary searches in the machine's slice and a difference of
+        the running totals. The operational time is the gaps between the window's
+        failures, plus the time from the period start to the first failure and from
+        the last failure to the period end.
+        """
+        starts, finishes = self.store.starts, self.store.finishes
+        cum_downtime, cum_gap = self.store.cum_downtime, self.store.cum_gap
+        machine_first, machine_end = self.first, self.end
+
+        totals = []
+        for low, high, period_start_ts, period_end_ts in bounds:
+            first = machine_first if low is None else bisect_left(starts, low, machine_first, machine_end)
+            last = machine_end if high is None else bisect_left(starts, high, machine_first, machine_end)
+            if first == last:
+                totals.append(NO_FAILURES)
+                continue
+
+            operational_seconds = cum_gap[last] - cum_gap[first + 1]
+            if period_start_ts is not None:
+                operational_seconds += abs(starts[first] - period_start_ts)
+            if finishes[last - 1] != NO_FINISH:
+                operational_seconds += abs(period_end_ts - finishes[last - 1])
+            totals.append((cum_downtime[last] - cum_downtime[first], operational_seconds, last - first))
+        return totals
@@ -0,0 +1,397 @@
+"""
+KPI engines for the breakdown reports, shared by mtbr.py and mtbrQuarter.py.
+
+compute_kpis is the KPI API: any list of (start, end) windows for any machines, answered
+from one sorted scan of the pre-parsed breakdown_intervals table (see maintenance/schema.py)
+with prefix sums. calculate_quarter_totals does the same for the quarterly_kpi rows, and
+rollup_totals adds the exact per-machine totals up per plant, department and work center.
+calculate_kpis and calculate_kpis_for_quarter are the per-machine reference queries on
+the reports text columns, used by --verify. The batch engines take an optional
+equipment_range so maintenance/parallel.py can run them on one shard of the machines.
+"""
+from datetime import datetime
+
+from . import instrument, vectorized
+from .intervals import NO_FAILURES, IntervalStore, load_chunks
+from .periods import epoch_seconds, hundredths, seconds_difference, start_ts_range
+
+# machines columns the KPIs are rolled up by, see rollup_totals
+ROLLUP_LEVELS = ('PLANT', 'DEPARTMENT', 'WORK_CENTER')
+
+
+# --- Core Logic Function: KPI Calculation ---
+def calculate_kpis(cursor, machine_id, start_date_obj=None, end_date_obj=None):
+    """
+    Calculates DT, MTTR, and MTBR for a specific machine within a date range.
+    
+    start_date_obj: datetime object representing the start of the period, None for all time.
+    end_date_obj: datetime object representing the end of the period (inclusive), default now.
+
+    Only breakdowns whose START_DATE / START_TIME parse (START_TS is not NULL) count, for
+    all time too: a start that is not a date has no place in the START_TS order, and
+    breakdown_intervals, which the batch engines read, leaves those reports out as well.
+
+    The downtime minutes and operational seconds are summed exactly and rounded half up
+    with totals_kpis, like the batch engines, so their results must be equal.
+    """
+    end_date_obj = end_date_obj or datetime.now()
+    
+    # 1. Build the SQL Query with date filtering
+    sql_base = '''
+        SELECT DOWNTIME, START_DATE, START_TIME, FINISH_DATE, FINISH_TIME
+        FROM REPORTS
+        WHERE BREAKDOWN = 'X' AND EQUIPMENT = ?
+    '''
+    params = [machine_id]
+    
+    if start_date_obj:
+        # NOTE: START_DATE is stored as text ('MM/DD/YYYY'), which does not sort by date.
+        # We filter on the numeric START_TS instead, covering whole days like BETWEEN did,
+        # so the (EQUIPMENT, BREAKDOWN, START_TS) index answers it with a range scan.
+        sql_base += " AND START_TS >= ? AND START_TS < ? ORDER BY START_TS ASC"
+        params.extend(start_ts_range(start_date_obj, end_date_obj))
+    else:
+        # For 'All Time'; unlike the original START_DATE sort, reports whose start
+        # does not parse are left out (see the docstring)
+        sql_base += " AND START_TS IS NOT NULL ORDER BY START_TS ASC"
+
+
+    # 2. Execute the query
+    cursor.execute(sql_base, tuple(params))
+    results = cursor.fetchall()
+
+    
+    # 3. Process results
+    total_downtime = 0 # minutes
+    failure_count = 0
+    total_operational_time = 0 # seconds
+    
+    # Time of the last reported failure (used for MTBR calculation)
+    last_finish_dt_str = ''
+
+    # Get the period start time for MTBR calculation
+    period_start_dt_str = f"{start_date_obj.strftime('%m/%d/%Y')} 00:00:00" if start_date_obj else None
+    
+    # If there are reports
+    if results:
+        # Time from period start to first failure (or 'All Time' start to first failure)
+        first_report = results[0]
+        first_start_dt_str = f"{first_report[1]} {first_report[2]}"
+
+        if period_start_dt_str:
+            # Add time from start of period to start of first failure
+            time_to_first = seconds_difference(period_start_dt_str, first_start_dt_str)
+            total_operational_time += time_to_first
+        
+        # Calculate time between failures and total downtime/count
+        for row in results:
+            downtime_minutes = row[0] if row[0] else 0
+            start_date, start_time, finish_date, finish_time = row[1], row[2], row[3], row[4]
+            
+            # Use FINISH_DATE/TIME if available, otherwise use START_DATE/TIME
+            current_finish_date = finish_date if finish_date else start_date
+            current_finish_time = finish_time if finish_time else start_time
+            current_finish_dt_str = f"{current_finish_date} {current_finish_time}"
+            
+            # MTTR and DT Calculation
+            total_downtime += downtime_minutes # Assuming DOWNTIME is in minutes
+            failure_count += 1
+            
+            # MTBR Calculation (Time between failure finish and next failure start)
+            if last_finish_dt_str:
+                time_between_failures = seconds_difference(last_finish_dt_str, f"{start_date} {start_time}")
+                total_operational_time += time_between_failures
+            
+            # Update the last finish time for the next iteration
+            last_finish_dt_str = current_finish_dt_str
+
+        # Time from last failure to period end (MTBR completion)
+        if last_finish_dt_str:
+            period_end_dt_str = f"{end_date_obj.strftime('%m/%d/%Y %H:%M:%S')}"
+            time_from_last = seconds_difference(last_finish_dt_str, period_end_dt_str)
+            total_operational_time += time_from_last
+    
+    # 4. Final KPI Calculation
+    # MTTR (Mean Time To Repair) = Total Downtime / Failure Count
+    # MTBR (Mean Time Between Repair) = Total Operational Time / Failure Count
+    dt, mttr_avg, mtbr_avg, _ = totals_kpis(total_downtime, total_operational_time, failure_count)
+    return dt, mttr_avg, mtbr_avg
+
+
+# --- Helper Function: Pre-parsed Intervals ---
+def period_bounds(start_date_obj, end_date_obj):
+    """
+    Returns (low, high, period_start_ts, period_end_ts) of a period in START_TS seconds.
+
+    low / high is the [low, high) START_TS filter and period_start_ts the midnight the
+    MTBR time starts counting from, all None for all time. period_end_ts is the second
+    the MTBR time stops counting at.
+
+    >>> period_bounds(datetime(1970, 1, 2, 12), datetime(1970, 1, 3, 6, 0, 0, 500))
+    (86400, 259200, 86400, 194400)
+    >>> period_bounds(None, datetime(1970, 1, 1, 1))
+    (None, None, None, 3600)
+    """
+    period_end_ts = epoch_seconds(end_date_obj)
+    if not start_date_obj:
+        return None, None, None, period_end_ts
+    low, high = start_ts_range(start_date_obj, end_date_obj)
+    return low, high, low, period_end_ts
+
+def machine_window_totals(starts, finishes, downtimes, bounds):
+    """
+    Returns the (downtime minutes, operational seconds, COUNT) of one machine for each period_bounds() window.
+
+    The running totals of downtime and of the gaps between failures are built once;
+    each window is then two binary searches and a difference of totals, so adding a
+    window costs almost nothing. Gaps are summed in whole seconds, so the totals are
+    exact. A missing FINISH_TS adds no time, like an unparsable FINISH does in
+    calculate_kpis. compute_totals does the same for all machines from an IntervalStore.
+
+    >>> machine_window_totals((0, 7200), (3600, None), (60, 30), [(None, None, None, 10800), (3600, 7201, 3600, 7200)])
+    [(90.0, 3600, 2), (30.0, 3600, 1)]
+    """
+    store = IntervalStore.from_rows(zip([None] * len(starts), starts, finishes, downtimes))
+    intervals = store.get(None)
+    return intervals.window_totals(bounds) if intervals else [NO_FAILURES] * len(bounds)
+
+def totals_kpis(downtime_minutes, operational_seconds, failure_count):
+    """
+    Returns (DT, MTTR, MTBR, COUNT) in hours, rounded half up, from exact totals.
+
+    For a group of machines this is the weighted MTTR / MTBR: total time over total
+    failures, not the average of the machines' averages.
+
+    >>> totals_kpis(90, 3600, 2), totals_kpis(0, 0, 0)
+    ((1.5, 0.75, 0.5, 2), (0.0, 0.0, 0.0, 0))
+    """
+    if not failure_count:
+        return 0.0, 0.0, 0.0, 0
+    return (hundredths(downtime_minutes, 60), hundredths(downtime_minutes, 60 * failure_count),
+            hundredths(operational_seconds, 3600 * failure_count), failure_count)
+
+def kpis_match(expected, actual):
+    """
+    Compares calculate_kpis results with the batch engine's; both round with hundredths, so exactly.
+
+    actual may carry COUNT after the values expected has.
+
+    >>> kpis_match((1.0, 0.13, 3.0), (1.0, 0.13, 3.0, 8))
+    True
+    >>> kpis_match((1.0, 0.12, 3.0), (1.0, 0.13, 3.0, 8))
+    False
+    """
+    return tuple(expected) == tuple(actual[:len(expected)])
+
+
+# --- Core Logic Function: Batch KPI Calculation ---
+def compute_totals(cursor, machine_ids, windows=(), work=None, periods_by_key=None, use_numpy=False,
+                   equipment_range=None):
+    """
+    Calculates the totals of arbitrary windows and of quarters from one read of the intervals.
+
+    windows: list of (start, end) datetimes, calculated for every machine in machine_ids.
+    work: dict of (year, quarter) -> machines to recalculate in that quarter, with
+        periods_by_key: dict of (year, quarter) -> quarter_periods() entry.
+    equipment_range: optional (first, last) EQUIPMENT to read, for one shard of machine_ids.
+
+    mtbr.py and mtbrQuarter.py each use one half (see compute_kpi_totals and
+    calculate_quarter_totals); pipeline.py refreshes both in a single pass.
+
+    Returns machine_id -> (list of (downtime minutes, operational seconds, COUNT) per window,
+    dict of (year, quarter) -> totals for the machine's quarters in work).
+    """
+    bounds = [period_bounds(start_date_obj, end_date_obj) for start_date_obj, end_date_obj in windows]
+    quarter_bounds = {key: period_bounds(period['start'], period['end'])
+                      for key, period in (periods_by_key or {}).items()}
+
+    # machine -> the quarters to recalculate for it
+    machine_ids = set(machine_ids)
+    quarters_by_machine = {}
+    for key in sorted(work or {}):
+        for machine in work[key]:
+            if machine in machine_ids:
+                quarters_by_machine.setdefault(machine, []).append(key)
+
+    # Machines without any breakdown keep the zero KPIs calculate_kpis returns
+    empty = [NO_FAILURES] * len(bounds)
+    results = {machine: (empty, dict.fromkeys(quarters_by_machine.get(machine, ()), NO_FAILURES))
+               for machine in machine_ids}
+    if not bounds and not quarters_by_machine:
+        return results
+
+    if use_numpy:
+        # The NumPy backend loads every breakdown once, then takes all machines per window
+        with instrument.phase('query'):
+            breakdowns = vectorized.load_breakdowns(cursor, equipment_range)
+        with instrument.phase('compute'):
+            window_totals = [vectorized.window_totals(breakdowns, *bound) for bound in bounds]
+            quarter_totals = {key: vectorized.window_totals(breakdowns, *quarter_bounds[key])
+                              for key in sorted(work or {}) if key in quarter_bounds}
+            for machine in machine_ids:
+                results[machine] = ([window.get(machine, NO_FAILURES) for window in window_totals],
+                                    {key: quarter_totals[key].get(machine, NO_FAILURES)
+                                     for key in quarters_by_machine.get(machine, ())})
+        return results
+
+    # The intervals are read once, a chunk of machines at a time, into typed arrays; each
+    # machine's slice answers its windows and quarters together. Fetching and converting
+    # the next chunk is timed as 'query', the rest as 'compute'.
+    with instrument.phase('compute'):
+        for store in instrument.timed(load_chunks(cursor, equipment_range), 'query'):
+            for intervals in store:
+                if intervals.machine in results:
+                    keys = quarters_by_machine.get(intervals.machine, [])
+                    machine_totals = intervals.window_totals(bounds + [quarter_bounds[key] for key in keys])
+                    results[intervals.machine] = (machine_totals[:len(bounds)],
+                                                  dict(zip(keys, machine_totals[len(bounds):])))
+
+    return results
+
+def compute_kpi_totals(cursor, equipment_ids, windows, use_numpy=False, equipment_range=None):
+    """
+    Returns the exact totals behind compute_kpis: machine_id -> list of
+    (downtime minutes, operational seconds, COUNT), one per window.
+
+    These add up across machines, which is what the plant / department / work center
+    rollups are built from.
+    """
+    totals = compute_totals(cursor, equipment_ids, windows, use_numpy=use_numpy, equipment_range=equipment_range)
+    return {machine: window_totals for machine, (window_totals, _) in totals.items()}
+
+def compute_kpis(cursor, equipment_ids, windows, use_numpy=False, equipment_range=None):
+    """
+    Calculates DT, MTTR, MTBR and COUNT for every machine and every window in one scan.
+
+    windows: list of (start, end) datetimes, start None for all time; e.g. year_periods(),
+        month_period() or trailing_period(30) from maintenance.periods.
+    use_numpy: use the NumPy backend in maintenance/vectorized.py (same results).
+    equipment_range: optional (first, last) EQUIPMENT to read, for one shard of equipment_ids.
+
+    Reads each machine's pre-parsed intervals once from breakdown_intervals in start
+    order and answers every window from their prefix sums.
+
+    Returns a dict of machine_id -> list of (DT, MTTR, MTBR, COUNT), one per window.
+    """
+    totals = compute_kpi_totals(cursor, equipment_ids, windows, use_numpy, equipment_range)
+    return {machine: [totals_kpis(*window) for window in windows_totals] for machine, windows_totals in totals.items()}
+
+
+# --- Core Logic Function: Rollups ---
+def load_machine_groups(cursor):
+    """Returns EQUIPMENT -> (PLANT, DEPARTMENT, WORK_CENTER) from the machines table."""
+    cursor.execute(f"SELECT EQUIPMENT, {', '.join(ROLLUP_LEVELS)} FROM machines")
+    return {machine: tuple(groups) for machine, *groups in cursor.fetchall()}
+
+def rollup_totals(totals, machine_groups):
+    """
+    Adds up per-machine totals per plant, department and work center.
+
+    totals: machine_id -> list of (downtime minutes, operational seconds, COUNT) per period,
+        as returned by compute_kpi_totals.
+    machine_groups: machine_id -> (PLANT, DEPARTMENT, WORK_CENTER), see load_machine_groups.
+    Machines that are not in machines, or have no value for a level, are left out of it.
+
+    Returns (LEVEL, NAME) -> (number of machines, list of summed totals per period).
+
+    >>> rollup_totals({1: [(60, 7200, 1)], 2: [(30, 0, 2)]}, {1: (1000, 'PRESS', 5001), 2: (1000, 'PRESS', None)})
+    {('PLANT', 1000): (2, [(90, 7200, 3)]), ('DEPARTMENT', 'PRESS'): (2, [(90, 7200, 3)]), ('WORK_CENTER', 5001): (1, [(60, 7200, 1)])}
+    """
+    rollups = {}
+    for machine, machine_totals in totals.items():
+        for level, name in zip(ROLLUP_LEVELS, machine_groups.get(machine, ())):
+            if name is None:
+                continue
+            machines, group_totals = rollups.get((level, name), (0, [NO_FAILURES] * len(machine_totals)))
+            rollups[(level, name)] = (machines + 1, [
+                tuple(group + own for group, own in zip(group_total, machine_total))
+                for group_total, machine_total in zip(group_totals, machine_totals)
+            ])
+    return rollups
+
+
+# --- Core Logic Function: KPI Calculation for a Single Machine/Period ---
+def calculate_kpis_for_quarter(cursor, machine_id, q_start, q_end):
+    """
+    Calculates DT, MTTR, MTBR, and COUNT for a specific machine within a quarter.
+
+    Rounded half up from exact totals, like calculate_kpis.
+    """
+    
+    # 1. Prepare the START_TS range and SQL
+    # START_DATE is text (MM/DD/YYYY) and does not sort by date, so filter on START_TS
+    start_ts, end_ts = start_ts_range(q_start, q_end)
+    
+    # SQL to fetch relevant reports (ordered for MTBR calculation)
+    sql_query = '''
+        SELECT DOWNTIME, START_DATE, START_TIME, FINISH_DATE, FINISH_TIME
+        FROM REPORTS
+        WHERE BREAKDOWN = 'X' AND EQUIPMENT = ?
+        AND START_TS >= ? AND START_TS < ?
+        ORDER BY START_TS ASC
+    '''
+    cursor.execute(sql_query, (machine_id, start_ts, end_ts))
+    results = cursor.fetchall()
+    
+    # 2. Process results
+    total_downtime = 0 # minutes
+    failure_count = 0
+    total_operational_time = 0 # seconds
+    last_finish_dt_str = None
+    
+    period_start_dt_str = f"{q_start.strftime('%m/%d/%Y')} 00:00:00"
+    period_end_dt_str = f"{q_end.strftime('%m/%d/%Y %H:%M:%S')}"
+    
+    if results:
+        # Time from quarter start to first failure
+        first_report = results[0]
+        first_start_dt_str = f"{first_report[1]} {first_report[2]}"
+        time_to_first = seconds_difference(period_start_dt_str, first_start_dt_str)
+        total_operational_time += time_to_first
+        
+        # Calculate time between failures and total downtime/count
+        for row in results:
+            downtime_minutes = row[0] if row[0] else 0
+            start_date, start_time, finish_date, finish_time = row[1], row[2], row[3], row[4]
+            
+            # Get the report's end time
+            current_finish_date = finish_date if finish_date else start_date
+            current_finish_time = finish_time if finish_time else start_time
+            current_finish_dt_str = f"{current_finish_date} {current_finish_time}"
+            
+            # DT and COUNT Calculation
+            total_downtime += downtime_minutes # Assuming DOWNTIME is in minutes
+            failure_count += 1
+            
+            # MTBR Calculation (Time between failure finish and next failure start)
+            if last_finish_dt_str:
+                time_between_failures = seconds_difference(last_finish_dt_str, f"{start_date} {start_time}")
+                total_operational_time += time_between_failures
+            
+            last_finish_dt_str = current_finish_dt_str
+
+        # Time from last failure to quarter end
+        if last_finish_dt_str:
+            time_from_last = seconds_difference(last_finish_dt_str, period_end_dt_str)
+            total_operational_time += time_from_last
+    
+    # 3. Final KPI Calculation, rounded like calculate_kpis
+    return totals_kpis(total_downtime, total_operational_time, failure_count)
+
+
+# --- Core Logic Function: Batch Quarterly KPI Calculation ---
+def calculate_quarter_totals(cursor, machine_ids, work, periods_by_key, use_numpy=False, equipment_range=None):
+    """
+    Calculates the quarterly totals for the (quarter, machine) pairs in work.
+
+    work: dict of (year, quarter) -> machines to recalculate in that quarter.
+    periods_by_key: dict of (year, quarter) -> quarter_periods() entry.
+    machine_ids / equipment_range: only these machines of work are calculated (one shard).
+
+    Returns a dict of (machine, year, quarter) -> (downtime minutes, operational seconds, COUNT);
+    totals_kpis turns them into the quarterly_kpi values.
+    """
+    totals = compute_totals(cursor, machine_ids, (), work, periods_by_key, use_numpy, equipment_range)
+    return {(machine, year, quarter): quarter_totals
+            for machine, (_, machine_quarters) in totals.items()
+            for (year, quarter), quarter_totals in machine_quarters.items()}
@@ -0,0 +1,105 @@
+"""
+Ingest manifest: which CSV exports were imported, so the import scripts only read what is new.
+
+Every imported file gets an ingest_manifest row (see schema.ensure_ingest_manifest) with
+its size, modification time and SHA-256, written in the same transaction as its rows.
+On the next run a file with the same size and mtime is skipped without reading it; a
+file whose first SIZE bytes still hash to HASH only had rows appended, and is read
+from byte SIZE on; anything else is read in full, as before.
+"""
+import hashlib
+import os
+
+from .schema import ensure_ingest_manifest
+
+# Bytes hashed per read
+HASH_CHUNK = 1 << 20
+
+
+def csv_paths(path):
+    """Returns [path] for a file, or the .csv files of a directory in name order (e.g. daily delta files)."""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith('.csv'))
+    return [path]
+
+
+def _hashes(path, size, prefix_size=None):
+    """Returns the SHA-256 of the first size bytes of path, and of its first prefix_size bytes (or None)."""
+    digest = hashlib.sha256()
+    prefix = None
+    with open(path, 'rb') as f:
+        for stop, is_prefix in ((prefix_size, True), (size, False)):
+            if stop is None:
+                continue
+            while f.tell() < stop:
+                data = f.read(min(HASH_CHUNK, stop - f.tell()))
+                if not data:
+                    break
+                digest.update(data)
+            if is_prefix:
+                prefix = digest.hexdigest()
+    return digest.hexdigest(), prefix
+
+
+def plan_import(cursor, path, kind):
+    """
+    Compares path with its manifest row and returns (action, offset, fingerprint).
+
+    action: 'new' (never imported), 'unchanged', 'touched' (same content, new mtime: nothing
+    to read, but record the fingerprint), 'appended' (the imported content is still the
+    start of the file; read it from byte offset) or 'changed' (read it in full).
+    fingerprint: (SIZE, MTIME_NS, HASH) to pass to record_import with the imported rows.
+    kind: 'reports' or 'machines', so high_water_mark can tell the exports apart.
+    """
+    ensure_ingest_manifest(cursor)
+    stat = os.stat(path)
+    cursor.execute("SELECT SIZE, MTIME_NS, HASH FROM ingest_manifest WHERE PATH = ?", (os.path.abspath(path),))
+    row = cursor.fetchone()
+    if row and (row[0], row[1]) == (stat.st_size, stat.st_mtime_ns):
+        return 'unchanged', stat.st_size, tuple(row)
+
+    # Only the bytes the stat saw are hashed, in case the export is still being written
+    imported_size = row[0] if row and row[0] < stat.st_size else None
+    full_hash, prefix_hash = _hashes(path, stat.st_size, imported_size)
+    fingerprint = (stat.st_size, stat.st_mtime_ns, full_hash)
+    if row is None:
+        return 'new', 0, fingerprint
+    if full_hash == row[2]:
+        # Touched or copied again, same content
+        return 'touched', stat.st_size, fingerprint
+    if prefix_hash == row[2]:
+        return 'appended', imported_size, fingerprint
+    return 'changed', 0, fingerprint
+
+
+def record_import(cursor, path, kind, fingerprint, rows, max_notification=None, max_start_ts=None, append=False):
+    """
+    Writes path's manifest row after an import, in the caller's transaction.
+
+    rows, max_notification and max_start_ts describe what was read this time; with
+    append=True (an 'appended' or 'touched' plan) they are added to the file's earlier values.
+    """
+    ensure_ingest_manifest(cursor)
+    size, mtime_ns, content_hash = fingerprint
+    cursor.execute('''
+        INSERT INTO ingest_manifest(PATH, KIND, SIZE, MTIME_NS, HASH, ROWS, MAX_NOTIFICATION, MAX_START_TS, IMPORTED)
+        VALUES (:path, :kind, :size, :mtime_ns, :hash, :rows, :max_notification, :max_start_ts,
+                datetime('now', 'localtime'))
+        ON CONFLICT(PATH) DO UPDATE SET KIND = excluded.KIND, SIZE = excluded.SIZE,
+            MTIME_NS = excluded.MTIME_NS, HASH = excluded.HASH, IMPORTED = excluded.IMPORTED,
+            ROWS = excluded.ROWS + CASE WHEN :append THEN ROWS ELSE 0 END,
+            MAX_NOTIFICATION = CASE WHEN :append THEN MAX(COALESCE(MAX_NOTIFICATION, :max_notification),
+                                                         COALESCE(:max_notification, MAX_NOTIFICATION))
+                                    ELSE :max_notification END,
+            MAX_START_TS = CASE WHEN :append THEN MAX(COALESCE(MAX_START_TS, :max_start_ts),
+                                                     COALESCE(:max_start_ts, MAX_START_TS))
+                                ELSE :max_start_ts END
+    ''', {'path': os.path.abspath(path), 'kind': kind, 'size': size, 'mtime_ns': mtime_ns, 'hash': content_hash,
+          'rows': rows, 'max_notification': max_notification, 'max_start_ts': max_start_ts, 'append': append})
+
+
+def high_water_mark(cursor, kind):
+    """Returns the highest NOTIFICATION imported from any file of kind, or None."""
+    ensure_ingest_manifest(cursor)
+    cursor.execute("SELECT MAX(MAX_NOTIFICATION) FROM ingest_manifest WHERE KIND = ?", (kind,))
+    return cursor.fetchone()[0]
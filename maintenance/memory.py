@@ -0,0 +1,51 @@
+"""
+In-memory snapshots of maintenance.db for the KPI scripts' --in-memory mode.
+
+The KPI calculation only reads. With --in-memory the tables it reads are copied into a
+:memory: database once, in one sequential pass per table inside one read transaction,
+and every calculation query then runs against RAM instead of the file (which on the
+work laptop sits on a network drive). The results are written to the file as usual,
+through the changed-rows-only writes in writes.py, in one transaction.
+
+The copy needs roughly the tables' size on disk in memory; master.py --summary shows it.
+"""
+import sqlite3
+from pathlib import Path
+
+from .db import connect, get_db_path
+
+
+def snapshot(tables=None, path=None):
+    """
+    Returns a :memory: connection holding a copy of tables, with their indexes.
+
+    tables: table names to copy; None copies the whole database with the backup API.
+    path: database file, defaults to get_db_path().
+    Tables that do not exist in the file are left out. Triggers are not copied.
+    """
+    path = path or get_db_path()
+    memory = sqlite3.connect('file::memory:', uri=True)
+    if tables is None:
+        disk = connect(path, readonly=True)
+        disk.backup(memory)
+        disk.close()
+        return memory
+
+    memory.execute('ATTACH DATABASE ? AS disk', (f'{Path(path).absolute().as_uri()}?mode=ro',))
+    # One transaction, so all tables are copied as of the same moment
+    memory.execute('BEGIN')
+    for table in tables:
+        cursor = memory.execute('''SELECT type, sql FROM disk.sqlite_master
+                                   WHERE tbl_name = ? COLLATE NOCASE AND type IN ('table', 'index')
+                                   AND sql IS NOT NULL ORDER BY type = 'index' ''', (table,))
+        objects = cursor.fetchall()
+        if not objects:
+            continue
+        memory.execute(objects[0][1])
+        # Rows come out in key order, so the copy appends to the b-tree; indexes are built afterwards
+        memory.execute(f'INSERT INTO main.{table} SELECT * FROM disk.{table}')
+        for _, sql in objects[1:]:
+            memory.execute(sql)
+    memory.commit()
+    memory.execute('DETACH DATABASE disk')
+    return memory
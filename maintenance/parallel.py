@@ -0,0 +1,86 @@
+"""
+Runs a KPI engine over the machines in parallel worker processes.
+
+The machines are split into contiguous EQUIPMENT shards. Each worker process opens
+its own read-only connection once and runs the engine on one shard at a time, with
+the shard's (first, last) EQUIPMENT so the engine only reads that EQUIPMENT range of
+breakdown_intervals, a seek on its primary key. Shard results are merged in shard order and
+every machine's KPIs are computed from its own rows only, so the output is the same
+for any number of workers. Writing stays in the calling script, in one transaction.
+
+The engines and their arguments are pickled to the workers, so they must be plain
+module-level functions and the calling scripts need an `if __name__ == '__main__':`
+guard (Windows starts the workers by re-importing the script).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .db import connect
+
+# Shards per worker; more, smaller shards keep the workers busy when some
+# machines have far more breakdowns than others
+SHARDS_PER_WORKER = 4
+
+# The worker process's read-only connection, opened by _init_worker
+_worker_db = None
+
+
+def default_workers():
+    """Returns the number of CPUs available to this process."""
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+
+def shard_machines(machine_ids, shards):
+    """
+    Splits the machines into at most `shards` contiguous, sorted shards of similar size.
+
+    >>> shard_machines([5, 1, 4, 2, 3], 2)
+    [[1, 2, 3], [4, 5]]
+    >>> shard_machines([1, 2], 4)
+    [[1], [2]]
+    >>> shard_machines([], 3)
+    []
+    """
+    machine_ids = sorted(machine_ids)
+    shards = max(1, min(shards, len(machine_ids)))
+    size, extra = divmod(len(machine_ids), shards)
+
+    result = []
+    start = 0
+    for i in range(shards if machine_ids else 0):
+        end = start + size + (1 if i < extra else 0)
+        result.append(machine_ids[start:end])
+        start = end
+    return result
+
+
+def _init_worker(db_path):
+    """Opens the worker's read-only connection once, for all the shards it runs."""
+    global _worker_db
+    _worker_db = connect(db_path, readonly=True)
+
+
+def _run_shard(task, shard, args):
+    """Runs task on one shard with the worker's connection."""
+    return task(_worker_db.cursor(), shard, *args, equipment_range=(shard[0], shard[-1]))
+
+
+def run_sharded(task, cursor, machine_ids, args=(), workers=1, db_path=None):
+    """
+    Calls task(cursor, machine_ids, *args, equipment_range=...) per shard and merges the dicts.
+
+    task: a module-level KPI engine returning a dict, e.g. kpi.compute_kpis.
+    cursor: used when workers is 1, which runs everything in this process as before.
+    workers: number of worker processes.
+    db_path: database the workers open read-only, defaults to get_db_path().
+    """
+    if workers <= 1 or len(machine_ids) <= 1:
+        return task(cursor, machine_ids, *args)
+
+    shards = shard_machines(machine_ids, workers * SHARDS_PER_WORKER)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_path,)) as pool:
+        # map() yields in submission order, whatever order the shards finish in
+        for shard_results in pool.map(_run_shard, [task] * len(shards), shards, [args] * len(shards)):
+            results.update(shard_results)
+    return results
@@ -0,0 +1,256 @@
+"""
+Period, quarter and timestamp helpers shared by the KPI and table scripts.
+
+The examples in the docstrings are the tests: python -m doctest maintenance/periods.py
+"""
+from datetime import datetime, timedelta
+
+# START_TS / FINISH_TS in reports are seconds since this date of the wall-clock time
+# in the report (no timezone conversion), so they sort and subtract like the text dates
+EPOCH = datetime(1970, 1, 1)
+
+DATETIME_FORMAT = '%m/%d/%Y %H:%M:%S'
+
+
+# --- Quarters ---
+def get_quarter(month):
+    """
+    Calculates the quarter (1-4) from a given month (1-12).
+
+    >>> [get_quarter(month) for month in (1, 3, 4, 12)]
+    [1, 1, 2, 4]
+    """
+    return (month + 2) // 3
+
+def quarter_start(year, quarter):
+    """
+    Returns the first moment of a quarter.
+
+    >>> quarter_start(2024, 3)
+    datetime.datetime(2024, 7, 1, 0, 0)
+    """
+    return datetime(year, quarter * 3 - 2, 1)
+
+def next_quarter(year, quarter):
+    """
+    Returns the (year, quarter) after the given one.
+
+    >>> next_quarter(2024, 2), next_quarter(2024, 4)
+    ((2024, 3), (2025, 1))
+    """
+    return (year + 1, 1) if quarter == 4 else (year, quarter + 1)
+
+def quarter_table_name(year, quarter):
+    """
+    Returns the legacy Q{n}_{year} name of a quarter.
+
+    >>> quarter_table_name(2016, 1)
+    'Q1_2016'
+    """
+    return f"Q{quarter}_{year}"
+
+def generate_quarters(start_year, start_month=1, now=None):
+    """
+    Generates the (year, quarter) pairs from a start date up to the current quarter, in order.
+
+    >>> generate_quarters(2023, 8, now=datetime(2024, 4, 2))
+    [(2023, 3), (2023, 4), (2024, 1), (2024, 2)]
+    """
+    now = now or datetime.now()
+    last = (now.year, get_quarter(now.month))
+
+    quarters = []
+    current = (start_year, get_quarter(start_month))
+    while current <= last:
+        quarters.append(current)
+        current = next_quarter(*current)
+    return quarters
+
+def generate_quarter_tables(start_year, start_month=1, now=None):
+    """
+    Generates the legacy quarterly table names from a start date up to the current quarter.
+
+    >>> generate_quarter_tables(2023, 10, now=datetime(2024, 1, 5))
+    ['Q4_2023', 'Q1_2024']
+    """
+    return [quarter_table_name(year, quarter) for year, quarter in generate_quarters(start_year, start_month, now)]
+
+def quarter_periods(start_year, start_month=1, now=None):
+    """
+    Generates the quarters up to the current one with their date ranges.
+
+    Each entry is a dict with 'name', 'year', 'quarter', 'start' and 'end'. The end is
+    one second before the next quarter starts, capped at now for the current quarter.
+
+    >>> periods = quarter_periods(2024, now=datetime(2024, 5, 6, 7, 8, 9))
+    >>> [(p['name'], p['start'].date().isoformat(), p['end'].isoformat(' ')) for p in periods]
+    [('Q1_2024', '2024-01-01', '2024-03-31 23:59:59'), ('Q2_2024', '2024-04-01', '2024-05-06 07:08:09')]
+    """
+    now = now or datetime.now()
+
+    periods = []
+    for year, quarter in generate_quarters(start_year, start_month, now):
+        # End date is one second before the next quarter starts
+        q_end = quarter_start(*next_quarter(year, quarter)) - timedelta(seconds=1)
+        periods.append({
+            'name': quarter_table_name(year, quarter),
+            'year': year,
+            'quarter': quarter,
+            'start': quarter_start(year, quarter),
+            # Cap the end date at the current time if it's the current quarter
+            'end': min(q_end, now),
+        })
+    return periods
+
+def year_periods(now=None):
+    """
+    Returns the (start, end) windows of the kpi table: all time, previous year and YTD.
+
+    >>> for start, end in year_periods(datetime(2024, 5, 6, 7, 8, 9)):
+    ...     print(start, '->', end)
+    None -> 2024-05-06 07:08:09
+    2023-01-01 00:00:00 -> 2023-12-31 23:59:59
+    2024-01-01 00:00:00 -> 2024-05-06 07:08:09
+    """
+    now = now or datetime.now()
+    this_year_start = datetime(now.year, 1, 1)
+    prev_year_start = datetime(now.year - 1, 1, 1)
+    prev_year_end = this_year_start - timedelta(seconds=1) # Dec 31st of previous year
+    return [(None, now), (prev_year_start, prev_year_end), (this_year_start, now)]
+
+def month_period(now=None):
+    """
+    Returns the month-to-date (start, end) window of the kpi table's MONTH columns.
+
+    >>> month_period(datetime(2024, 5, 6, 7, 8, 9))
+    (datetime.datetime(2024, 5, 1, 0, 0), datetime.datetime(2024, 5, 6, 7, 8, 9))
+    """
+    now = now or datetime.now()
+    return datetime(now.year, now.month, 1), now
+
+def trailing_period(days, now=None):
+    """
+    Returns the (start, end) window of the last `days` calendar days, today included.
+
+    >>> trailing_period(30, datetime(2024, 5, 6, 7, 8, 9))
+    (datetime.datetime(2024, 4, 7, 0, 0), datetime.datetime(2024, 5, 6, 7, 8, 9))
+    """
+    now = now or datetime.now()
+    start = now - timedelta(days=days - 1)
+    return datetime(start.year, start.month, start.day), now
+
+
+# --- Timestamps ---
+def parse_datetime(dt_str):
+    """
+    Parses a 'MM/DD/YYYY HH:MM:SS' string, or returns None if it does not parse.
+
+    The legacy '24:00:00' time is read as the last second of the day.
+
+    >>> parse_datetime('02/29/2024 24:00:00')
+    datetime.datetime(2024, 2, 29, 23, 59, 59)
+    >>> parse_datetime('02/30/2024 10:00:00') is None
+    True
+    """
+    if '24:00:00' in dt_str:
+        dt_str = dt_str.replace('24:00:00', '23:59:59')
+    try:
+        return datetime.strptime(dt_str, DATETIME_FORMAT)
+    except ValueError:
+        return None
+
+def hours_between(time1, time2):
+    """
+    Returns the absolute difference in hours between two datetimes, 0.0 if either is missing.
+
+    >>> hours_between(datetime(2024, 1, 1, 6), datetime(2024, 1, 1, 4, 30))
+    1.5
+    >>> hours_between(None, datetime(2024, 1, 1))
+    0.0
+    """
+    if time1 is None or time2 is None:
+        return 0.0
+    return abs((time1 - time2).total_seconds()) / 3600.0
+
+def hundredths(numerator, denominator):
+    """
+    Returns numerator / denominator rounded half up to 2 decimals, for exact totals.
+
+    Works on ints and on NumPy arrays alike. Unlike round(), a value exactly halfway
+    (e.g. 927 minutes over 2 failures, 7.725 hours) does not depend on float noise.
+
+    >>> hundredths(927, 60 * 2), round(927 / 60 / 2, 2)
+    (7.73, 7.72)
+    >>> hundredths(0, 3600)
+    0.0
+    """
+    return ((200 * numerator + denominator) // (2 * denominator)) / 100
+
+def time_difference(start_dt_str, finish_dt_str):
+    """
+    Calculates the time difference in hours between two datetime strings.
+
+    >>> time_difference('01/01/2024 22:00:00', '01/01/2024 24:00:00')
+    1.9997222222222222
+    >>> time_difference('not a date', '01/01/2024 10:00:00')
+    0.0
+    """
+    return hours_between(parse_datetime(start_dt_str), parse_datetime(finish_dt_str))
+
+def seconds_difference(start_dt_str, finish_dt_str):
+    """
+    Calculates the time difference in whole seconds between two datetime strings, like time_difference.
+
+    >>> seconds_difference('01/01/2024 22:00:00', '01/01/2024 24:00:00')
+    7199
+    >>> seconds_difference('not a date', '01/01/2024 10:00:00')
+    0
+    """
+    start, finish = parse_datetime(start_dt_str), parse_datetime(finish_dt_str)
+    if start is None or finish is None:
+        return 0
+    return int(abs((finish - start).total_seconds()))
+
+def epoch_seconds(dt):
+    """
+    Returns the START_TS / FINISH_TS value of a datetime.
+
+    >>> epoch_seconds(datetime(1970, 1, 2))
+    86400
+    """
+    return int((dt - EPOCH).total_seconds())
+
+def to_epoch(date_str, time_str):
+    """
+    Converts 'MM/DD/YYYY' and 'HH:MM:SS' strings to epoch seconds, or None if they do not parse.
+
+    >>> to_epoch('01/02/1970', '00:00:00'), to_epoch('', '10:00:00')
+    (86400, None)
+    """
+    if not date_str or not time_str:
+        return None
+    parsed = parse_datetime(f"{date_str} {time_str}")
+    return None if parsed is None else epoch_seconds(parsed)
+
+def report_timestamps(start_date, start_time, finish_date, finish_time):
+    """
+    Returns (START_TS, FINISH_TS) for a report, falling back to the start when FINISH is missing.
+
+    >>> report_timestamps('01/02/1970', '00:00:00', '', '')
+    (86400, 86400)
+    """
+    start_ts = to_epoch(start_date, start_time)
+    finish_ts = to_epoch(finish_date if finish_date else start_date,
+                         finish_time if finish_time else start_time)
+    return start_ts, finish_ts
+
+def start_ts_range(start_date_obj, end_date_obj):
+    """
+    Returns the [low, high) START_TS bounds covering every day from start to end (inclusive).
+
+    >>> start_ts_range(datetime(1970, 1, 1, 12), datetime(1970, 1, 2, 8))
+    (0, 172800)
+    """
+    low = datetime(start_date_obj.year, start_date_obj.month, start_date_obj.day)
+    high = datetime(end_date_obj.year, end_date_obj.month, end_date_obj.day) + timedelta(days=1)
+    return epoch_seconds(low), epoch_seconds(high)
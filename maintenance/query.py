@@ -0,0 +1,205 @@
+"""
+Read-only KPI queries with a connection pool and a result cache, used by kpiServer.py.
+
+Every answer is cached in an LRU keyed on the query and its arguments. The cache is
+dropped as soon as a KPI job commits new results, which the jobs signal by bumping
+kpi_generation (see writes.bump_generation) in the same transaction as their writes.
+The generation is re-read at most every GENERATION_CHECK_SECONDS, so a client polling
+an unchanged answer is served from memory without touching the database at all.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .db import connect
+from .kpi import ROLLUP_LEVELS
+
+# Connections kept open for the request threads
+POOL_SIZE = 4
+# Answers kept in the cache
+CACHE_SIZE = 1024
+# Seconds between two reads of kpi_generation
+GENERATION_CHECK_SECONDS = 1.0
+
+# The PERIOD values of kpi_rollup
+PERIOD_NAMES = ('ALL', 'PREVIOUS', 'YTD', 'MONTH')
+
+# Returned by ResultCache.get on a miss, so None can be a cached answer
+MISSING = object()
+
+
+class ConnectionPool:
+    """A fixed number of read-only connections shared by the request threads."""
+
+    def __init__(self, db_path=None, size=POOL_SIZE):
+        self._connections = queue.Queue()
+        for _ in range(size):
+            # Each connection is used by one thread at a time, but not always the same one
+            self._connections.put(connect(db_path, readonly=True, check_same_thread=False))
+
+    @contextmanager
+    def cursor(self):
+        """Borrows a connection for the block and yields a cursor on it."""
+        db = self._connections.get()
+        try:
+            yield db.cursor()
+        finally:
+            self._connections.put(db)
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU of query answers for one KPI generation.
+
+    >>> cache = ResultCache(2)
+    >>> cache.put('a', 1); cache.put('b', 2); cache.get('a')
+    1
+    >>> cache.put('c', 3); cache.get('b') is MISSING
+    True
+    >>> cache.stats()['size']
+    2
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._answers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            answer = self._answers.get(key, MISSING)
+            if answer is MISSING:
+                self.misses += 1
+                return MISSING
+            self._answers.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, key, answer):
+        with self._lock:
+            self._answers[key] = answer
+            self._answers.move_to_end(key)
+            if len(self._answers) > self.size:
+                self._answers.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._answers.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._answers), 'capacity': self.size, 'hits': self.hits, 'misses': self.misses}
+
+
+# --- Queries ---
+def _rows(cursor, sql, params=()):
+    """Runs sql and returns the rows as dicts keyed by column name."""
+    cursor.execute(sql, params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def read_generation(cursor):
+    """Returns the sum of the kpi_generation counters, 0 before any KPI job has run."""
+    try:
+        cursor.execute("SELECT COALESCE(SUM(GENERATION), 0) FROM kpi_generation")
+    except sqlite3.OperationalError:
+        return 0
+    return cursor.fetchone()[0]
+
+def machine_kpis(cursor, equipment):
+    """The kpi row of one machine with its machines details, or None."""
+    rows = _rows(cursor, '''
+        SELECT k.*, m.DESCRIPTION, m.PLANT, m.DEPARTMENT, m.WORK_CENTER
+        FROM kpi k LEFT JOIN machines m ON m.EQUIPMENT = k.EQUIPMENT
+        WHERE k.EQUIPMENT = ?
+    ''', (equipment,))
+    return rows[0] if rows else None
+
+def machine_quarters(cursor, equipment):
+    """One machine's quarterly KPIs, oldest quarter first."""
+    return _rows(cursor, '''
+        SELECT YEAR, QUARTER, DT, MTTR, MTBR, COUNT FROM quarterly_kpi
+        WHERE EQUIPMENT = ? ORDER BY YEAR, QUARTER
+    ''', (equipment,))
+
+def quarter_kpis(cursor, year, quarter):
+    """Every machine's KPIs for one quarter."""
+    return _rows(cursor, '''
+        SELECT EQUIPMENT, DT, MTTR, MTBR, COUNT FROM quarterly_kpi
+        WHERE YEAR = ? AND QUARTER = ? ORDER BY EQUIPMENT
+    ''', (year, quarter))
+
+def rollups(cursor, level, name=None, period=None):
+    """kpi_rollup rows of one level, optionally for one group and / or one period."""
+    sql = 'SELECT LEVEL, NAME, PERIOD, DT, MTTR, MTBR, COUNT, MACHINES FROM kpi_rollup WHERE LEVEL = ?'
+    params = [level]
+    if name is not None:
+        sql += ' AND NAME = ?'
+        params.append(name)
+    if period is not None:
+        sql += ' AND PERIOD = ?'
+        params.append(period)
+    return _rows(cursor, sql + ' ORDER BY NAME, PERIOD', params)
+
+def quarterly_rollups(cursor, level, name=None, year=None):
+    """quarterly_rollup rows of one level, optionally for one group and / or one year."""
+    sql = '''SELECT LEVEL, NAME, YEAR, QUARTER, DT, MTTR, MTBR, COUNT, MACHINES
+             FROM quarterly_rollup WHERE LEVEL = ?'''
+    params = [level]
+    if name is not None:
+        sql += ' AND NAME = ?'
+        params.append(name)
+    if year is not None:
+        sql += ' AND YEAR = ?'
+        params.append(year)
+    return _rows(cursor, sql + ' ORDER BY NAME, YEAR, QUARTER', params)
+
+
+class KpiQueries:
+    """The queries above, answered from the cache while kpi_generation is unchanged."""
+
+    def __init__(self, db_path=None, pool_size=POOL_SIZE, cache_size=CACHE_SIZE):
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.cache = ResultCache(cache_size)
+        self.generation = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def check_generation(self):
+        """Drops the cache when a KPI job committed since the last check; returns the generation."""
+        with self._lock:
+            now = time.monotonic()
+            if self.generation is None or now - self._checked >= GENERATION_CHECK_SECONDS:
+                with self.pool.cursor() as cursor:
+                    generation = read_generation(cursor)
+                if generation != self.generation:
+                    self.cache.clear()
+                    self.generation = generation
+                self._checked = now
+            return self.generation
+
+    def answer(self, query, *args):
+        """Returns query(cursor, *args), from the cache when possible."""
+        generation = self.check_generation()
+        key = (query.__name__, *args)
+        answer = self.cache.get(key)
+        if answer is MISSING:
+            with self.pool.cursor() as cursor:
+                answer = query(cursor, *args)
+            # Not cached if a new generation was seen meanwhile; the answer may predate it
+            if generation == self.generation:
+                self.cache.put(key, answer)
+        return answer
+
+    def status(self):
+        return {'generation': self.check_generation(), 'cache': self.cache.stats(),
+                'levels': list(ROLLUP_LEVELS), 'periods': list(PERIOD_NAMES)}
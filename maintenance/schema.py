@@ -0,0 +1,238 @@
+"""
+Table, view and trigger definitions that more than one script creates.
+
+Everything here is idempotent, so scripts call these before they rely on the objects.
+"""
+import sqlite3
+
+from .periods import quarter_table_name
+
+REPORTS_INDEX = 'reports_equipment_breakdown_start'
+
+# Columns whose changes can change a breakdown's KPIs
+KPI_REPORT_COLUMNS = [
+    'EQUIPMENT', 'BREAKDOWN', 'DOWNTIME', 'START_DATE', 'START_TIME',
+    'FINISH_DATE', 'FINISH_TIME', 'START_TS', 'FINISH_TS',
+]
+
+
+def create_reports_index(cursor):
+    """Creates the (EQUIPMENT, BREAKDOWN, START_TS) index the per-machine window queries seek on."""
+    cursor.execute(f'''CREATE INDEX IF NOT EXISTS {REPORTS_INDEX}
+                       ON reports(EQUIPMENT, BREAKDOWN, START_TS)''')
+
+
+def create_quarterly_kpi(cursor):
+    """
+    Creates the quarterly_kpi fact table.
+
+    One row per machine per quarter, keyed so a machine's trend across all quarters
+    is a single primary key range seek:
+        SELECT * FROM quarterly_kpi WHERE EQUIPMENT = ? ORDER BY YEAR, QUARTER
+    and indexed by quarter, so one quarter of every machine (the Q{n}_{year} views,
+    mtbrQuarter.plan_work, kpiServer.py /quarters/<year>/<quarter>) is an index seek too.
+    A partial index holds the rows mbtrMachineUpdate.py added that no run has filled yet.
+    """
+    cursor.execute('''CREATE TABLE IF NOT EXISTS quarterly_kpi(EQUIPMENT integer, YEAR integer, QUARTER integer,
+        DT integer, MTTR integer, MTBR integer, COUNT integer,
+        PRIMARY KEY (EQUIPMENT, YEAR, QUARTER)) WITHOUT ROWID''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS quarterly_kpi_year_quarter ON quarterly_kpi(YEAR, QUARTER)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS quarterly_kpi_unfilled ON quarterly_kpi(YEAR, QUARTER) WHERE COUNT IS NULL')
+
+
+def create_rollup_tables(cursor):
+    """
+    Creates kpi_rollup and quarterly_rollup, the per plant / department / work center KPIs.
+
+    LEVEL is 'PLANT', 'DEPARTMENT' or 'WORK_CENTER' and NAME that column's value in machines,
+    so a dashboard reads one department's periods with a single primary key range seek:
+        SELECT * FROM kpi_rollup WHERE LEVEL = 'DEPARTMENT' AND NAME = ?
+    MTTR and MTBR are weighted by failure count; MACHINES is the number of machines rolled up.
+    """
+    # NAME has no type so PLANT / WORK_CENTER numbers and DEPARTMENT text keep their own types
+    cursor.execute('''CREATE TABLE IF NOT EXISTS kpi_rollup(LEVEL text, NAME, PERIOD text,
+        DT integer, MTTR integer, MTBR integer, COUNT integer, MACHINES integer,
+        PRIMARY KEY (LEVEL, NAME, PERIOD)) WITHOUT ROWID''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS quarterly_rollup(LEVEL text, NAME, YEAR integer, QUARTER integer,
+        DT integer, MTTR integer, MTBR integer, COUNT integer, MACHINES integer,
+        PRIMARY KEY (LEVEL, NAME, YEAR, QUARTER)) WITHOUT ROWID''')
+
+
+def create_quarter_view(cursor, year, quarter):
+    """
+    Creates the read-only Q{n}_{year} compatibility view over quarterly_kpi.
+
+    A database that still has the old per-quarter table keeps it (IF NOT EXISTS)
+    until migrateDb.py copies it into quarterly_kpi.
+    """
+    cursor.execute(f"""CREATE VIEW IF NOT EXISTS {quarter_table_name(year, quarter)} AS
+        SELECT EQUIPMENT, MTBR, MTTR, DT, COUNT FROM quarterly_kpi
+        WHERE YEAR = {int(year)} AND QUARTER = {int(quarter)}""")
+
+
+def ensure_tracking_tables(cursor):
+    """Creates the dirty-quarter and watermark tables if they do not exist yet."""
+    # Filled by the reports triggers from ensure_dirty_tracking. SEQ changes every time a
+    # pair is marked, so mtbrQuarter.py only clears the marks it has read.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS dirty_quarters(EQUIPMENT integer, YEAR integer, QUARTER integer,
+        SEQ integer, PRIMARY KEY (EQUIPMENT, YEAR, QUARTER)) WITHOUT ROWID''')
+    if 'SEQ' not in [row[1] for row in cursor.execute("PRAGMA table_info('dirty_quarters')")]:
+        cursor.execute('ALTER TABLE dirty_quarters ADD COLUMN SEQ integer')
+    # The quarter of a job's last successful run; quarters from there on are still open
+    cursor.execute('''CREATE TABLE IF NOT EXISTS kpi_watermark(NAME text PRIMARY KEY,
+        YEAR integer, QUARTER integer)''')
+
+
+def ensure_run_generation(cursor):
+    """
+    Creates kpi_generation, one counter per KPI job that it bumps in the transaction of its writes.
+
+    Readers such as kpiServer.py cache KPI answers until SUM(GENERATION) changes.
+    """
+    cursor.execute('''CREATE TABLE IF NOT EXISTS kpi_generation(NAME text PRIMARY KEY,
+        GENERATION integer, UPDATED text)''')
+
+
+def ensure_ingest_manifest(cursor):
+    """
+    Creates ingest_manifest, one row per CSV file the import scripts have read.
+
+    SIZE, MTIME_NS and HASH (SHA-256 of the first SIZE bytes) identify the content that
+    was imported, so an unchanged export is skipped and an appended one is read from
+    byte SIZE on. MAX_NOTIFICATION / MAX_START_TS are the highest values imported from it.
+    """
+    cursor.execute('''CREATE TABLE IF NOT EXISTS ingest_manifest(PATH text PRIMARY KEY, KIND text,
+        SIZE integer, MTIME_NS integer, HASH text, ROWS integer,
+        MAX_NOTIFICATION integer, MAX_START_TS integer, IMPORTED text)''')
+
+
+def ensure_report_archives(cursor):
+    """
+    Creates report_archives, one row per year whose reports were moved to an archive database.
+
+    PATH is the archive's file name, relative to the directory of maintenance.db, and
+    [START_TS, END_TS) the year's START_TS range (see maintenance/archive.py).
+    """
+    cursor.execute('''CREATE TABLE IF NOT EXISTS report_archives(YEAR integer PRIMARY KEY, PATH text,
+        START_TS integer, END_TS integer, ROWS integer, ARCHIVED text)''')
+
+
+def ensure_dirty_tracking(cursor):
+    """Installs the triggers that record which (EQUIPMENT, quarter) pairs gained or changed breakdowns."""
+    ensure_tracking_tables(cursor)
+
+    # mtbrQuarter.py recalculates exactly these pairs (plus the open quarter) and clears them.
+    # The quarter is taken from START_TS, the same column the quarterly KPI filter uses.
+    # The triggers are recreated on every run so databases pick up changes to them.
+    for name, event, ref in (
+        ('reports_dirty_insert', 'INSERT', 'NEW'),
+        ('reports_dirty_update_old', 'UPDATE', 'OLD'),
+        ('reports_dirty_update_new', 'UPDATE', 'NEW'),
+        ('reports_dirty_delete', 'DELETE', 'OLD'),
+    ):
+        columns = f" OF {', '.join(KPI_REPORT_COLUMNS)}" if event == 'UPDATE' else ''
+        year = f"CAST(strftime('%Y', {ref}.START_TS, 'unixepoch') AS integer)"
+        quarter = f"(CAST(strftime('%m', {ref}.START_TS, 'unixepoch') AS integer) + 2) / 3"
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        # A pair that is already dirty gets a new SEQ, so a run that read the old one
+        # leaves it dirty. The quarter expressions are repeated rather than joined with
+        # UPDATE ... FROM, which needs SQLite 3.33 (see writes.HAVE_UPDATE_FROM).
+        # NOT EXISTS rather than INSERT OR IGNORE: a trigger's conflict policy is
+        # overridden by the statement that fires it, e.g. the --bulk upsert
+        cursor.execute(f'''
+            CREATE TRIGGER {name} AFTER {event}{columns} ON reports
+            WHEN {ref}.BREAKDOWN = 'X' AND {ref}.START_TS IS NOT NULL
+            BEGIN
+                UPDATE dirty_quarters SET SEQ = COALESCE(SEQ, 0) + 1
+                WHERE EQUIPMENT = {ref}.EQUIPMENT AND YEAR = {year} AND QUARTER = {quarter};
+                INSERT INTO dirty_quarters(EQUIPMENT, YEAR, QUARTER, SEQ)
+                SELECT {ref}.EQUIPMENT, {year}, {quarter}, 1
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM dirty_quarters d
+                    WHERE d.EQUIPMENT = {ref}.EQUIPMENT AND d.YEAR = {year} AND d.QUARTER = {quarter}
+                );
+            END
+        ''')
+
+
+def ensure_breakdown_intervals(cursor):
+    """
+    Creates and maintains breakdown_intervals, the pre-parsed copy of the breakdown reports.
+
+    One compact row per breakdown with the START_TS / FINISH_TS already converted, clustered
+    by equipment and start time, so the KPI scripts read intervals without parsing any
+    date strings or touching the wide reports rows. It is filled from reports the first time
+    and kept current by triggers on reports, whichever script or tool writes to it.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'breakdown_intervals'")
+    exists = cursor.fetchone() is not None
+
+    # NOTIFICATION breaks START_TS ties in the same order as the reports index
+    cursor.execute('''CREATE TABLE IF NOT EXISTS breakdown_intervals(EQUIPMENT integer, START_TS integer,
+        NOTIFICATION integer, FINISH_TS integer, DOWNTIME integer,
+        PRIMARY KEY (EQUIPMENT, START_TS, NOTIFICATION)) WITHOUT ROWID''')
+    if not exists:
+        cursor.execute('''INSERT INTO breakdown_intervals(EQUIPMENT, START_TS, NOTIFICATION, FINISH_TS, DOWNTIME)
+            SELECT EQUIPMENT, START_TS, NOTIFICATION, FINISH_TS, DOWNTIME FROM reports
+            WHERE BREAKDOWN = 'X' AND START_TS IS NOT NULL''')
+
+    # Changed rows are deleted by their old key and inserted again if they still qualify
+    remove_old = '''DELETE FROM breakdown_intervals
+        WHERE EQUIPMENT = OLD.EQUIPMENT AND START_TS = OLD.START_TS AND NOTIFICATION = OLD.NOTIFICATION;'''
+    insert_new = '''INSERT INTO breakdown_intervals(EQUIPMENT, START_TS, NOTIFICATION, FINISH_TS, DOWNTIME)
+        SELECT NEW.EQUIPMENT, NEW.START_TS, NEW.NOTIFICATION, NEW.FINISH_TS, NEW.DOWNTIME
+        WHERE NEW.BREAKDOWN = 'X' AND NEW.START_TS IS NOT NULL;'''
+    columns = ', '.join(['NOTIFICATION'] + KPI_REPORT_COLUMNS)
+    for name, event, body in (
+        ('reports_intervals_insert', 'INSERT', insert_new),
+        ('reports_intervals_update', f'UPDATE OF {columns}', remove_old + insert_new),
+        ('reports_intervals_delete', 'DELETE', remove_old),
+    ):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'CREATE TRIGGER {name} AFTER {event} ON reports BEGIN {body} END')
+
+
+def _rtree_values(ref):
+    """The breakdown_rtree values of breakdown_intervals row ref; a finish before the start is swapped."""
+    start, finish = f'{ref}.START_TS', f'COALESCE({ref}.FINISH_TS, {ref}.START_TS)'
+    low, high = f'MIN({start}, {finish})', f'MAX({start}, {finish})'
+    return f'{ref}.NOTIFICATION, {low}, {high}, {ref}.EQUIPMENT, {low}, {high}'
+
+
+def ensure_downtime_index(cursor):
+    """
+    Creates and maintains breakdown_rtree, an R*Tree over the breakdown intervals.
+
+    "Which machines were down at T" and "which breakdowns overlap a range" become R*Tree
+    searches (logarithmic plus the matches) instead of scans of breakdown_intervals.
+    LOW / HIGH are the interval in the R*Tree's 32-bit floats, which it rounds outwards;
+    DOWN_FROM / DOWN_UNTIL hold the exact START_TS and FINISH_TS (START_TS again when
+    there is none) for the final filter. Triggers on breakdown_intervals keep it current,
+    so it follows reports through the same chain of triggers.
+
+    Returns False when this SQLite library was built without the R*Tree module; the
+    queries in maintenance/downtime.py then scan breakdown_intervals instead.
+    """
+    ensure_breakdown_intervals(cursor)
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'breakdown_rtree'")
+    exists = cursor.fetchone() is not None
+
+    try:
+        cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS breakdown_rtree USING rtree(NOTIFICATION, LOW, HIGH,
+            +EQUIPMENT, +DOWN_FROM, +DOWN_UNTIL)''')
+    except sqlite3.OperationalError:
+        return False  # no such module: rtree
+
+    columns = 'NOTIFICATION, LOW, HIGH, EQUIPMENT, DOWN_FROM, DOWN_UNTIL'
+    if not exists:
+        cursor.execute(f'INSERT INTO breakdown_rtree({columns}) SELECT {_rtree_values("breakdown_intervals")} FROM breakdown_intervals')
+
+    # breakdown_intervals is only ever changed by deletes and inserts (see ensure_breakdown_intervals)
+    for name, event, body in (
+        ('breakdown_rtree_insert', 'INSERT',
+         f'INSERT OR REPLACE INTO breakdown_rtree({columns}) VALUES ({_rtree_values("NEW")});'),
+        ('breakdown_rtree_delete', 'DELETE', 'DELETE FROM breakdown_rtree WHERE NOTIFICATION = OLD.NOTIFICATION;'),
+    ):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'CREATE TRIGGER {name} AFTER {event} ON breakdown_intervals BEGIN {body} END')
+    return True
@@ -0,0 +1,136 @@
+"""
+Vectorized NumPy backend for the breakdown KPI calculations in maintenance/kpi.py.
+
+All breakdown intervals are fetched once from the pre-parsed breakdown_intervals table
+into arrays with per-machine prefix sums. The downtime, operational time and COUNT of a
+period, which kpi.totals_kpis turns into DT, MTTR and MTBR, are then computed for every
+machine at once with binary searches and array operations instead of
+a Python loop per row.
+
+NumPy is optional: HAVE_NUMPY is False when it is not installed and the scripts keep
+using the pure-Python path.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HAVE_NUMPY = np is not None
+
+
+# Bits of the combined (machine, START_TS) search key used for START_TS; about 544 years
+_TS_BITS = 34
+
+
+# --- Core Logic Function: Loading ---
+def load_breakdowns(cursor, equipment_range=None):
+    """
+    Fetches every breakdown interval once and prepares the per-machine prefix sums.
+
+    Reads the pre-parsed breakdown_intervals table, so no date strings are parsed here.
+    equipment_range: optional (first, last) EQUIPMENT, to load one shard of the machines.
+
+    Returns a dict of arrays: 'machines' and their 'firsts' / 'counts' rows, the rows'
+    'start_ts', 'finish_ts' and 'has_finish', the running totals 'cum_downtime' (minutes)
+    and 'cum_gap' (seconds from each finish to the next start of the same machine), and
+    the sorted 'key' that window_totals binary searches.
+    """
+    sql_range = 'WHERE EQUIPMENT BETWEEN ? AND ?' if equipment_range else ''
+    cursor.execute(f'''
+        SELECT EQUIPMENT, START_TS, FINISH_TS, DOWNTIME
+        FROM breakdown_intervals {sql_range}
+        ORDER BY EQUIPMENT, START_TS, NOTIFICATION
+    ''', tuple(equipment_range or ()))
+    rows = cursor.fetchall()
+    equipment, start_ts, finish_ts, downtime = zip(*rows) if rows else ((),) * 4
+
+    equipment = np.array(equipment, dtype=object)
+    start_ts = np.array(start_ts, dtype=np.int64)
+    has_finish = np.array([f is not None for f in finish_ts], dtype=bool)
+    finish_ts = np.array([f if f is not None else 0 for f in finish_ts], dtype=np.int64)
+    downtime = np.array([d if d else 0 for d in downtime], dtype=np.float64)
+
+    # Rows are sorted by equipment, so each machine is one contiguous group
+    change = np.ones(len(equipment), dtype=bool)
+    change[1:] = equipment[1:] != equipment[:-1]
+    firsts = np.flatnonzero(change)
+    counts = np.diff(np.append(firsts, len(equipment)))
+    group = np.repeat(np.arange(len(firsts), dtype=np.int64), counts)
+
+    # gap[i]: seconds from the previous failure's finish to failure i, within a machine.
+    # Integer seconds and minutes keep every prefix sum exact.
+    gap = np.zeros(len(start_ts), dtype=np.int64)
+    gap[1:] = np.where(has_finish[:-1], np.abs(start_ts[1:] - finish_ts[:-1]), 0)
+    gap[firsts] = 0
+
+    # (machine, START_TS) packed into one sorted int64 for np.searchsorted
+    ts_min = int(start_ts.min()) if len(start_ts) else 0
+    key = (group << _TS_BITS) + (start_ts - ts_min)
+
+    return {
+        'machines': equipment[firsts],
+        'firsts': firsts,
+        'counts': counts,
+        'start_ts': start_ts,
+        'finish_ts': finish_ts,
+        'has_finish': has_finish,
+        'cum_downtime': np.concatenate(([0.0], np.cumsum(downtime))),
+        'cum_gap': np.concatenate(([0], np.cumsum(gap))),
+        'key': key,
+        'ts_min': ts_min,
+    }
+
+# --- Core Logic Function: Grouped KPI Calculation ---
+def window_totals(breakdowns, low=None, high=None, period_start_ts=None, period_end_ts=None):
+    """
+    Calculates the downtime, operational time and COUNT of every machine within one period.
+
+    low / high: the [low, high) START_TS range of the period, or None for all time.
+    period_start_ts: START_TS the MTBR time starts counting from (None for all time).
+    period_end_ts: START_TS the MTBR time stops counting at.
+    The arguments are those of kpi.period_bounds().
+
+    Each machine's window is found with two binary searches and its totals are the
+    difference of two prefix sums, so a period costs O(machines log rows). Returns a
+    dict of machine_id -> (downtime minutes, operational seconds, COUNT) for machines
+    with at least one breakdown in the period; the values are identical to
+    kpi.machine_window_totals.
+    """
+    firsts = breakdowns['firsts']
+    if not len(firsts):
+        return {}
+
+    if low is None:
+        window_firsts = firsts
+        window_ends = firsts + breakdowns['counts']
+    else:
+        span = (1 << _TS_BITS) - 1
+        base = np.arange(len(firsts), dtype=np.int64) << _TS_BITS
+        ts_min = breakdowns['ts_min']
+        window_firsts = np.searchsorted(breakdowns['key'], base + min(max(low - ts_min, 0), span))
+        window_ends = np.searchsorted(breakdowns['key'], base + min(max(high - ts_min, 0), span))
+
+    counts = window_ends - window_firsts
+    present = counts > 0
+    window_firsts, window_ends, counts = window_firsts[present], window_ends[present], counts[present]
+    lasts = window_ends - 1
+
+    cum_downtime = breakdowns['cum_downtime']
+    cum_gap = breakdowns['cum_gap']
+    start_ts = breakdowns['start_ts']
+    finish_ts = breakdowns['finish_ts']
+    has_finish = breakdowns['has_finish']
+
+    # Downtime and the gaps between the window's failures, from the running totals
+    downtime_minutes = cum_downtime[window_ends] - cum_downtime[window_firsts]
+    operational = cum_gap[window_ends] - cum_gap[window_firsts + 1]
+
+    # Time from period start to the first failure and from the last failure to period end
+    if period_start_ts is not None:
+        operational += np.abs(start_ts[window_firsts] - period_start_ts)
+    operational += np.where(has_finish[lasts], np.abs(period_end_ts - finish_ts[lasts]), 0)
+
+    return {
+        machine: (float(minutes), int(seconds), int(count))
+        for machine, minutes, seconds, count in zip(breakdowns['machines'][present], downtime_minutes, operational, counts)
+    }
@@ -0,0 +1,100 @@
+"""
+Set-based writes of calculated KPI rows that only touch rows whose values changed.
+
+The KPI scripts recalculate every machine, but from one run to the next most values
+are the same. Rather than one UPDATE per row, the rows are loaded into a temp staging
+table with a single executemany and applied with one set-based statement that skips
+rows whose values are already in the table. Unchanged rows are not rewritten, so they
+cost no page writes, no WAL growth and no trigger work.
+"""
+import sqlite3
+
+from .schema import ensure_run_generation
+
+# UPDATE ... FROM needs SQLite 3.33; older libraries use a guarded executemany instead
+HAVE_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+
+def _stage(cursor, table, columns, rows):
+    """Loads rows into temp.{table}_staging, with the same column affinities as table."""
+    staging = f'{table}_staging'
+    cursor.execute(f'DROP TABLE IF EXISTS temp.{staging}')
+    cursor.execute(f"CREATE TEMP TABLE {staging} AS SELECT {', '.join(columns)} FROM {table} WHERE 0")
+    cursor.executemany(f"INSERT INTO {staging} VALUES ({', '.join('?' * len(columns))})", rows)
+    return staging
+
+
+def _changed(table, other, value_columns):
+    """SQL condition that is true where any value column of table differs from other."""
+    return ' OR '.join(f'{table}.{column} IS NOT {other}.{column}' for column in value_columns)
+
+
+def update_changed(cursor, table, key_columns, value_columns, rows):
+    """
+    Updates existing rows of table from (*values, *keys) tuples and returns how many changed.
+
+    Rows whose values are already stored, and keys that are not in the table, are
+    left alone. The caller commits.
+    """
+    assignments = ', '.join(f'{column} = ?' for column in value_columns)
+    if not HAVE_UPDATE_FROM:
+        keys = ' AND '.join(f'{column} = ?' for column in key_columns)
+        changed = ' OR '.join(f'{column} IS NOT ?' for column in value_columns)
+        # The values are bound twice: once to set them, once to compare with the stored ones
+        cursor.executemany(f'UPDATE {table} SET {assignments} WHERE {keys} AND ({changed})',
+                           [(*row, *row[:len(value_columns)]) for row in rows])
+        return cursor.rowcount
+
+    staging = _stage(cursor, table, [*value_columns, *key_columns], rows)
+    cursor.execute(f"CREATE UNIQUE INDEX temp.{staging}_key ON {staging}({', '.join(key_columns)})")
+    assignments = ', '.join(f'{column} = s.{column}' for column in value_columns)
+    keys = ' AND '.join(f'{table}.{column} = s.{column}' for column in key_columns)
+    cursor.execute(f'''
+        UPDATE {table} SET {assignments}
+        FROM {staging} AS s
+        WHERE {keys} AND ({_changed(table, 's', value_columns)})
+    ''')
+    changed = cursor.rowcount
+    cursor.execute(f'DROP TABLE temp.{staging}')
+    return changed
+
+
+def replace_changed(cursor, table, key_columns, value_columns, rows, scope_columns=()):
+    """
+    Makes table hold exactly rows, given as (*keys, *values) tuples, and returns how many changed.
+
+    New keys are inserted, changed values updated and identical rows left alone. Rows of
+    table that are not in rows are deleted, but only within the scope_columns values that
+    rows cover (e.g. YEAR, QUARTER: the quarters that were recalculated); with no
+    scope_columns every other row is deleted. The caller commits.
+    """
+    staging = _stage(cursor, table, [*key_columns, *value_columns], rows)
+    columns = ', '.join([*key_columns, *value_columns])
+    updates = ', '.join(f'{column} = excluded.{column}' for column in value_columns)
+    # "WHERE true" is required by SQLite to tell the upsert clause apart from a join
+    cursor.execute(f'''
+        INSERT INTO {table}({columns})
+        SELECT {columns} FROM {staging} WHERE true
+        ON CONFLICT({', '.join(key_columns)}) DO UPDATE SET {updates}
+        WHERE {_changed(table, 'excluded', value_columns)}
+    ''')
+    changed = cursor.rowcount
+
+    keys = ' AND '.join(f's.{column} = {table}.{column}' for column in key_columns)
+    sql_delete = f'DELETE FROM {table} WHERE NOT EXISTS (SELECT 1 FROM {staging} s WHERE {keys})'
+    if scope_columns:
+        scope = ' AND '.join(f's.{column} = {table}.{column}' for column in scope_columns)
+        sql_delete += f' AND EXISTS (SELECT 1 FROM {staging} s WHERE {scope})'
+    cursor.execute(sql_delete)
+    changed += cursor.rowcount
+    cursor.execute(f'DROP TABLE temp.{staging}')
+    return changed
+
+
+def bump_generation(cursor, name):
+    """Increments job name's kpi_generation counter; call it just before the job commits its KPIs."""
+    ensure_run_generation(cursor)
+    cursor.execute('''
+        INSERT INTO kpi_generation(NAME, GENERATION, UPDATED) VALUES (?, 1, datetime('now', 'localtime'))
+        ON CONFLICT(NAME) DO UPDATE SET GENERATION = GENERATION + 1, UPDATED = excluded.UPDATED
+    ''', (name,))
@@ -1,64 +1,236 @@
+import argparse
 import sqlite3
+import sys
+
+from maintenance import connect, get_db_path
 
 # --- Configuration ---
-# Choose the desired database path by uncommenting one line:
-# DB_PATH = 'H:\\Projects\\maintenance.db'
-DB_PATH = 'C:\\Projects\\Musashi\\maintenance.db' 
+# The database path comes from MAINTENANCE_DB / maintenance.ini (see maintenance/db.py)
+DB_PATH = get_db_path()
+
+# The queries the KPI scripts run, with sample parameters, for --check.
+# 'seek' queries must read a primary key or index range; 'scan' queries read the whole
+# table on purpose but must not need a sort. Keep in step with the code they come from.
+KPI_QUERIES = [
+    ('IntervalStore.load / load_breakdowns (mtbr.py, mtbrQuarter.py)', 'scan', 'breakdown_intervals', '''
+        SELECT EQUIPMENT, START_TS, FINISH_TS, DOWNTIME FROM breakdown_intervals
+        ORDER BY EQUIPMENT, START_TS, NOTIFICATION''', ()),
+    ('IntervalStore.load for one --workers shard', 'seek', 'breakdown_intervals', '''
+        SELECT EQUIPMENT, START_TS, FINISH_TS, DOWNTIME FROM breakdown_intervals
+        WHERE EQUIPMENT BETWEEN ? AND ? ORDER BY EQUIPMENT, START_TS, NOTIFICATION''', (0, 0)),
+    ('calculate_kpis / calculate_kpis_for_quarter (--verify)', 'seek', 'reports', '''
+        SELECT DOWNTIME, START_DATE, START_TIME, FINISH_DATE, FINISH_TIME FROM REPORTS
+        WHERE BREAKDOWN = 'X' AND EQUIPMENT = ? AND START_TS >= ? AND START_TS < ?
+        ORDER BY START_TS ASC''', (0, 0, 0)),
+    ('mtbrQuarter.plan_work machine list', 'seek', 'quarterly_kpi',
+        'SELECT EQUIPMENT FROM quarterly_kpi WHERE YEAR = ? AND QUARTER = 1', (2016,)),
+    # A scan of the partial index, which only holds the rows no run has filled
+    ('mtbrQuarter.plan_work unfilled rows', 'scan', 'quarterly_kpi',
+        'SELECT EQUIPMENT, YEAR, QUARTER FROM quarterly_kpi WHERE COUNT IS NULL', ()),
+    ('kpiServer.py /machines/<equipment>/quarters', 'seek', 'quarterly_kpi', '''
+        SELECT YEAR, QUARTER, DT, MTTR, MTBR, COUNT FROM quarterly_kpi
+        WHERE EQUIPMENT = ? ORDER BY YEAR, QUARTER''', (0,)),
+    ('kpiServer.py /quarters/<year>/<quarter>', 'seek', 'quarterly_kpi', '''
+        SELECT EQUIPMENT, DT, MTTR, MTBR, COUNT FROM quarterly_kpi
+        WHERE YEAR = ? AND QUARTER = ? ORDER BY EQUIPMENT''', (2016, 1)),
+    ('kpiServer.py /rollups/<level>', 'seek', 'kpi_rollup', '''
+        SELECT LEVEL, NAME, PERIOD, DT, MTTR, MTBR, COUNT, MACHINES FROM kpi_rollup
+        WHERE LEVEL = ? ORDER BY NAME, PERIOD''', ('DEPARTMENT',)),
+    ('load_machine_groups (rollups)', 'scan', 'machines',
+        'SELECT EQUIPMENT, PLANT, DEPARTMENT, WORK_CENTER FROM machines', ()),
+]
+
+
+# --- Helper Functions: Sizes and Row Estimates ---
+def object_sizes(cursor):
+    """
+    Returns name -> (pages, bytes) for every table and index, from one aggregate pass over dbstat.
+
+    Returns {} when this SQLite library was built without dbstat.
+    """
+    try:
+        cursor.execute("SELECT name, pageno, pgsize FROM dbstat WHERE aggregate = 1")
+    except sqlite3.OperationalError:
+        return {}
+    return {name: (pages, size) for name, pages, size in cursor.fetchall()}
+
+def row_estimates(cursor):
+    """
+    Returns table -> rows from sqlite_stat1, without COUNT(*) scans.
+
+    sqlite_stat1 (written by ANALYZE / PRAGMA optimize) holds a row count per table and
+    index as of its last run. Tables it does not cover are left out: their rows are unknown.
+    """
+    estimates = {}
+    try:
+        cursor.execute("SELECT tbl, stat FROM sqlite_stat1")
+    except sqlite3.OperationalError:
+        return estimates  # never analyzed
+    for table, stat in cursor.fetchall():
+        estimates[table] = max(int(stat.split()[0]), estimates.get(table, 0))
+    return estimates
+
+def format_bytes(size):
+    """Formats a byte count as B / KiB / MiB / GiB."""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            return f'{size} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+# --- Report: Summary ---
+def print_summary(cursor):
+    """Prints every table with its estimated rows, and every table and index with its pages and size."""
+    cursor.execute("SELECT type, name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index', 'view') ORDER BY tbl_name, type DESC, name")
+    objects = cursor.fetchall()
+    sizes = object_sizes(cursor)
+    estimates = row_estimates(cursor)
+    total = sum(size for _, size in sizes.values())
+
+    views = [name for kind, name, _ in objects if kind == 'view']
+    print(f"{'object':<60} {'rows':>12} {'pages':>8} {'size':>11} {'share':>6}")
+    for kind, name, table in sorted((o for o in objects if o[0] != 'view'),
+                                    key=lambda o: -sizes.get(o[1], (0, 0))[1]):
+        pages, size = sizes.get(name, (None, None))
+        label = name if kind == 'table' else f'  {name} (index on {table})'
+        rows_text = (f"{estimates[name]}~" if name in estimates else '?') if kind == 'table' else ''
+        size_text = format_bytes(size) if size is not None else '?'
+        share = f'{size / total * 100:5.1f}%' if size is not None and total else ''
+        print(f"{label:<60} {rows_text:>12} {pages if pages is not None else '?':>8} {size_text:>11} {share:>6}")
+
+    if not sizes:
+        print("(page usage needs an SQLite library built with dbstat)")
+    if estimates:
+        print("~ rows from sqlite_stat1 as of the last ANALYZE / PRAGMA optimize")
+    if any(kind == 'table' and name not in estimates for kind, name, _ in objects):
+        print("? rows unknown: not in sqlite_stat1; run PRAGMA optimize (or ANALYZE) on the database to estimate them")
+    print(f"{len(views)} views" + (f": {', '.join(views[:5])}{' ...' if len(views) > 5 else ''}" if views else ''))
+
+
+# --- Report: Table Structure ---
+def print_table(cursor, name):
+    """Prints the columns and indexes of one table or view."""
+    print(f"\n--- Schema for table: {name} ---")
+    # PRAGMA returns: (cid, name, type, notnull, dflt_value, pk)
+    cursor.execute(f"PRAGMA table_info('{name}')")
+    for row in cursor.fetchall():
+        print(f"  ID: {row[0]}, Name: {row[1]:<15}, Type: {row[2]:<8}, Primary Key: {bool(row[5])}")
+
+    cursor.execute(f"PRAGMA index_list('{name}')")
+    for _, index, unique, origin, _ in cursor.fetchall():
+        cursor.execute(f"PRAGMA index_info('{index}')")
+        columns = ', '.join(column for _, _, column in cursor.fetchall())
+        kind = {'pk': 'primary key', 'u': 'unique constraint'}.get(origin, 'unique index' if unique else 'index')
+        print(f"  {kind}: {index} ({columns})")
+    print('-' * 30)
 
-# --- Database Connection and Query ---
+
+# --- Report: Query Plans ---
+def check_queries(cursor):
+    """Prints EXPLAIN QUERY PLAN for the KPI queries and returns the warnings."""
+    warnings = []
+    for purpose, expect, table, sql, params in KPI_QUERIES:
+        print(f"\n{purpose}:")
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = [detail for _, _, _, detail in cursor.fetchall()]
+        except sqlite3.OperationalError as e:
+            print(f"  not checked: {e}")
+            continue
+        for detail in plan:
+            print(f"  {detail}")
+
+        if expect == 'seek' and any(detail.startswith('SCAN') and table.lower() in detail.lower() for detail in plan):
+            warnings.append(f"{purpose}: full scan of {table}; an index or primary key matching the WHERE clause is missing")
+        if any('TEMP B-TREE' in detail for detail in plan):
+            warnings.append(f"{purpose}: sorts through a temp b-tree; no index delivers the ORDER BY")
+
+    print()
+    for warning in warnings:
+        print(f"[WARNING] {warning}")
+    print(f"{len(warnings)} warnings for {len(KPI_QUERIES)} KPI queries.")
+    return warnings
+
+
+# --- Interactive Browser ---
+def browse(cursor):
+    """The original input loop: type a table name to see its structure."""
+    cursor.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') ORDER BY name")
+    objects = cursor.fetchall()
+    tables = [name for name, kind in objects if kind == 'table']
+    views = [name for name, kind in objects if kind == 'view']
+    known = set(tables) | set(views)
+
+    print(f"Tables found in {DB_PATH}:")
+    print(tables)
+    if views:
+        print(f"and {len(views)} views (e.g. {views[0]})")
+    print('-' * 30)
+    print('Enter the name of a table to see its structure, "summary" for sizes, "check" for the')
+    print('KPI query plans, or type "q" to quit.')
+
+    while True:
+        answer = input('Table name: ').strip() # .strip() removes leading/trailing spaces
+
+        if answer.lower() == 'q':
+            break
+        if not answer:
+            continue
+        if answer.lower() == 'summary':
+            print_summary(cursor)
+            continue
+        if answer.lower() == 'check':
+            check_queries(cursor)
+            continue
+
+        # Validation: only names from sqlite_master are put into the PRAGMA
+        if answer not in known:
+            print(f"Error: Table '{answer}' not found. Please check the list above.")
+            print('-' * 30)
+            continue
+
+        try:
+            print_table(cursor, answer)
+        except sqlite3.Error as e:
+            print(f"An unexpected database error occurred: {e}")
+            print('-' * 30)
+
+
+# --- Main Execution ---
+parser = argparse.ArgumentParser(description='Inspect maintenance.db: tables, sizes, indexes and KPI query plans.')
+parser.add_argument('--summary', action='store_true', help='Print row estimates and page usage per table and index.')
+parser.add_argument('--table', action='append', default=[], metavar='NAME', help='Print the structure of a table.')
+parser.add_argument('--check', action='store_true',
+                    help='Print the query plans of the KPI queries and warn about missing indexes '
+                         '(exit status 1 if there are warnings).')
+args = parser.parse_args()
+
+warnings = []
 try:
     # Using 'with' ensures the connection is closed automatically
-    with sqlite3.connect(DB_PATH) as db:
+    # Read-only: browsing never takes a write lock from the KPI scripts
+    with connect(DB_PATH, readonly=True) as db:
         cursor = db.cursor()
 
-        # Get a list of all table names
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        # Extract table names into a clean list for validation
-        tables = [t[0] for t in cursor.fetchall()]
-        
-        print(f"Tables found in {DB_PATH}:")
-        print(tables)
-        print('-' * 30)
-        print('Enter the name of a table to see its structure, or type "q" to quit.')
-
-        # --- User Interaction Loop ---
-        while True:
-            answer = input('Table name: ').strip() # .strip() removes leading/trailing spaces
-            
-            if answer.lower() == 'q':
-                break
-                
-            if not answer:
-                continue
-
-            # 1. Validation: Check if the table name exists in the database
-            if answer not in tables:
-                print(f"Error: Table '{answer}' not found. Please check the list above.")
-                print('-' * 30)
-                continue
-
-            # 2. Safe Execution: Execute the PRAGMA command with the validated name
-            try:
-                # PRAGMA is used to get the table information (column details)
-                print(f"\n--- Schema for table: {answer} ---")
-                
-                # We use an f-string here after validating 'answer' is a known table name
-                cursor.execute(f"PRAGMA table_info('{answer}')")
-                
-                # PRAGMA returns: (cid, name, type, notnull, dflt_value, pk)
-                for row in cursor.fetchall():
-                    # Format the output for readability
-                    print(f"  ID: {row[0]}, Name: {row[1]:<15}, Type: {row[2]:<8}, Primary Key: {bool(row[5])}")
-                
-                print('-' * 30)
-
-            except sqlite3.Error as e:
-                # Catch any unexpected database errors during PRAGMA execution
-                print(f"An unexpected database error occurred: {e}")
-                print('-' * 30)
-                
+        if not (args.summary or args.table or args.check):
+            browse(cursor)
+        else:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")
+            known = {name for (name,) in cursor.fetchall()}
+            if args.summary:
+                print_summary(cursor)
+            for name in args.table:
+                if name in known:
+                    print_table(cursor, name)
+                else:
+                    print(f"Error: Table '{name}' not found.")
+            if args.check:
+                warnings = check_queries(cursor)
+
 # Catch errors that occur before or during connection
 except sqlite3.Error as e:
     print(f"\n[FATAL ERROR] Could not connect to the database or retrieve data: {e}")
 except Exception as e:
     print(f"\n[FATAL ERROR] An unexpected error occurred: {e}")
+
+sys.exit(1 if warnings else 0)
@@ -1,51 +1,10 @@
 import sqlite3
-import csv
-from datetime import datetime
-from math import ceil
+import sys
 
-# --- Configuration ---
-# Choose the desired database path by uncommenting one line:
-# DB_PATH = r'H:\Projects\maintenance.db'
-DB_PATH = r'C:\Projects\Musashi\maintenance.db'
-
-# --- Helper Functions ---
-def get_quarter(month):
-    """Calculates the quarter (1-4) from a given month (1-12)."""
-    return ceil(month / 3)
-
-def generate_quarter_tables(start_year, start_month):
-    """Generates a list of quarterly table names from a start date up to the current quarter."""
-    today = datetime.now()
-    tables = []
-
-    # Calculate the current quarter's start date
-    current_year = today.year
-    current_quarter = get_quarter(today.month)
-    
-    # Set the loop start date
-    current_date = datetime(start_year, start_month, 1)
-
-    while True:
-        year = current_date.year
-        quarter = get_quarter(current_date.month)
-        table_name = f"Q{quarter}_{year}"
-        tables.append(table_name)
-        
-        # Stop condition: reached the current quarter
-        if year == current_year and quarter == current_quarter:
-            break
+from maintenance import connect, generate_quarters
 
-        # Move to the start of the next quarter
-        if quarter == 4:
-            next_month = 1
-            next_year = year + 1
-        else:
-            next_month = (quarter * 3) + 1
-            next_year = year
-
-        current_date = datetime(next_year, next_month, 1)
-
-    return tables
+# --- Configuration ---
+# The database path comes from MAINTENANCE_DB / maintenance.ini (see maintenance/db.py)
 
 
 # --- Main Execution ---
@@ -59,36 +18,42 @@ START_MONTH = 1
 
 try:
     # Use 'with' statement for safe and automatic closing of the connection
-    with sqlite3.connect(DB_PATH) as db:
+    with connect() as db:
         cursor = db.cursor()
 
-        # 1. Get the list of machines (Primary Keys)
-        cursor.execute("SELECT EQUIPMENT FROM machines")
-        # Ensure the results are tuples, which is what executemany expects
-        machines_rows = cursor.fetchall()
-        total_machines = len(machines_rows)
-
-        # 2. Get the list of quarterly tables dynamically
-        databases = generate_quarter_tables(START_YEAR, START_MONTH)
-
-        # 3. Insert machine IDs into all quarterly tables
-        for table_name in databases:
-            # Use INSERT OR IGNORE to handle duplicates directly in SQL
-            sql_insert = f'''INSERT OR IGNORE INTO {table_name}(EQUIPMENT) VALUES(?)'''
-            
-            # Use executemany for high efficiency
-            cursor.executemany(sql_insert, machines_rows)
-            
-            # Count added/ignored rows
-            rows_affected = cursor.rowcount
-            # total_machines - rows_affected = number of rows ignored/already existing
-            count_add += rows_affected
-            count_ignore += (total_machines - rows_affected)
+        # 1. Count the machines (only for the summary; the IDs never leave SQLite)
+        cursor.execute("SELECT COUNT(*) FROM machines")
+        total_machines = cursor.fetchone()[0]
+
+        # 2. Get the list of quarters dynamically, as a small temp table to join against
+        databases = generate_quarters(START_YEAR, START_MONTH)
+        cursor.execute("DROP TABLE IF EXISTS temp.quarters")
+        cursor.execute("CREATE TEMP TABLE quarters(YEAR integer, QUARTER integer)")
+        cursor.executemany("INSERT INTO quarters(YEAR, QUARTER) VALUES(?, ?)", databases)
+
+        # 3. Insert only the missing (machine, quarter) rows with one set-based statement.
+        # Each candidate is a primary key probe inside SQLite, so adding 5 new machines
+        # writes 5 rows per quarter instead of re-sending the whole machine list.
+        cursor.execute('''
+            INSERT INTO quarterly_kpi(EQUIPMENT, YEAR, QUARTER)
+            SELECT m.EQUIPMENT, q.YEAR, q.QUARTER
+            FROM machines m CROSS JOIN quarters q
+            WHERE NOT EXISTS (
+                SELECT 1 FROM quarterly_kpi k
+                WHERE k.EQUIPMENT = m.EQUIPMENT AND k.YEAR = q.YEAR AND k.QUARTER = q.QUARTER
+            )
+        ''')
+
+        # Count added/ignored rows
+        count_add = cursor.rowcount
+        # every other machine/quarter pair already existed
+        count_ignore = total_machines * len(databases) - count_add
+        cursor.execute("DROP TABLE temp.quarters")
 
         # Commit all changes after all insertions are complete
         db.commit() 
         
-        print(f"Update complete for {len(databases)} quarterly tables:")
+        print(f"Update complete for {len(databases)} quarters:")
         print(f'{count_add} machine entries were added.')
         print(f'{count_ignore} machine entries were ignored (already existed).')
 
@@ -97,3 +62,4 @@ except sqlite3.Error as e:
     # Rollback any pending changes on error
     if 'db' in locals():
         db.rollback()
+    sys.exit(1)
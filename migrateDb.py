@@ -0,0 +1,96 @@
+import re
+import sqlite3
+
+from maintenance import connect, report_timestamps
+from maintenance.schema import (
+    create_quarter_view,
+    create_quarterly_kpi,
+    create_reports_index,
+    ensure_downtime_index,
+)
+
+# --- Configuration ---
+# The database path comes from MAINTENANCE_DB / maintenance.ini (see maintenance/db.py)
+
+# Number of rows converted per executemany while backfilling
+BATCH_SIZE = 10000
+
+
+# --- Migration: Sortable Report Timestamps ---
+def migrate_report_timestamps(cursor):
+    """Adds and backfills START_TS / FINISH_TS on reports and indexes them per machine."""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info('reports')")]
+    for column in ('START_TS', 'FINISH_TS'):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE reports ADD COLUMN {column} integer")
+            print(f"Added column reports.{column}")
+
+    # Backfill every row that has not been converted yet
+    cursor.execute('''
+        SELECT NOTIFICATION, START_DATE, START_TIME, FINISH_DATE, FINISH_TIME
+        FROM reports WHERE START_TS IS NULL
+    ''')
+    rows = cursor.fetchall()
+
+    sql_update = 'UPDATE reports SET START_TS = ?, FINISH_TS = ? WHERE NOTIFICATION = ?'
+    updated = 0
+    for i in range(0, len(rows), BATCH_SIZE):
+        batch = [
+            (*report_timestamps(start_date, start_time, finish_date, finish_time), notification)
+            for notification, start_date, start_time, finish_date, finish_time in rows[i:i + BATCH_SIZE]
+        ]
+        cursor.executemany(sql_update, batch)
+        updated += len(batch)
+
+    unparsed = cursor.execute("SELECT COUNT(*) FROM reports WHERE START_TS IS NULL").fetchone()[0]
+    print(f"Converted {updated - unparsed} reports ({unparsed} have no valid START_DATE/START_TIME).")
+
+    # Per-machine window queries become index range scans on this index
+    create_reports_index(cursor)
+
+    # The KPI scripts read these timestamps from the breakdown_intervals copy, and
+    # downtime.py searches them through its R*Tree
+    ensure_downtime_index(cursor)
+
+
+# --- Migration: Per-Quarter Tables to quarterly_kpi ---
+def migrate_quarter_tables(cursor):
+    """Copies every legacy Q{n}_{year} table into quarterly_kpi and replaces it with a view."""
+    # Also adds the (YEAR, QUARTER) index to a quarterly_kpi created before it existed
+    create_quarterly_kpi(cursor)
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    legacy_tables = [name for (name,) in cursor.fetchall() if re.fullmatch(r'Q[1-4]_\d{4}', name)]
+
+    copied = 0
+    for table_name in legacy_tables:
+        quarter, year = (int(part) for part in table_name[1:].split('_'))
+
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO quarterly_kpi(EQUIPMENT, YEAR, QUARTER, DT, MTTR, MTBR, COUNT)
+            SELECT EQUIPMENT, ?, ?, DT, MTTR, MTBR, COUNT FROM {table_name}
+        ''', (year, quarter))
+        copied += cursor.rowcount
+
+        # Keep the old name working for existing queries and spreadsheets
+        cursor.execute(f"DROP TABLE {table_name}")
+        create_quarter_view(cursor, year, quarter)
+
+    print(f"Moved {copied} rows from {len(legacy_tables)} quarterly tables into quarterly_kpi.")
+
+
+# --- Main Execution ---
+try:
+    with connect() as db:
+        cursor = db.cursor()
+
+        migrate_report_timestamps(cursor)
+        migrate_quarter_tables(cursor)
+
+        db.commit()
+        print("Migration complete.")
+
+except sqlite3.Error as e:
+    print(f"\n[ERROR] A database error occurred: {e}")
+    if 'db' in locals():
+        db.rollback()
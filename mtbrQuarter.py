@@ -1,205 +1,242 @@
+import argparse
 import sqlite3
 import time
-from datetime import datetime, timedelta
-from math import ceil
+
+from maintenance import connect, quarter_periods
+from maintenance import instrument, vectorized
+from maintenance.archive import attach_archives, detach_archives, window_ts_range
+from maintenance.memory import snapshot
+from maintenance.parallel import run_sharded
+from maintenance.kpi import (
+    calculate_kpis_for_quarter,
+    calculate_quarter_totals,
+    kpis_match,
+    load_machine_groups,
+    rollup_totals,
+    totals_kpis,
+)
+from maintenance.schema import (
+    create_quarterly_kpi,
+    create_rollup_tables,
+    ensure_breakdown_intervals,
+    ensure_tracking_tables,
+)
+from maintenance.writes import bump_generation, replace_changed, update_changed
 
 # --- Configuration ---
-# Choose the desired database path
-DB_PATH = r'C:\Projects\Musashi\maintenance.db'
+# The database path comes from MAINTENANCE_DB / maintenance.ini (see maintenance/db.py)
 START_YEAR = 2016 # Define the starting year for your quarterly tables
 
-# --- Helper Function: Quarter Generation ---
-def get_quarter(month):
-    """Calculates the quarter (1-4) from a given month (1-12)."""
-    return ceil(month / 3)
-
-def generate_quarter_tables(start_year):
-    """Generates a list of quarterly table names and their date ranges up to the current quarter."""
-    NOW = datetime.now()
-    tables = []
-    
-    # Start on Q1 of the start year
-    current_date = datetime(start_year, 1, 1)
-
-    while True:
-        year = current_date.year
-        quarter = get_quarter(current_date.month)
-        table_name = f"Q{quarter}_{year}"
-        
-        # Calculate the start date and end date of the quarter
-        q_start = current_date
-        
-        # Determine the start of the next quarter
-        if quarter == 4:
-            next_month = 1
-            next_year = year + 1
-        else:
-            next_month = (quarter * 3) + 1
-            next_year = year
-        
-        next_quarter_start = datetime(next_year, next_month, 1)
-        # End date is one second before the next quarter starts
-        q_end = next_quarter_start - timedelta(seconds=1) 
-        
-        # Do not process future quarters
-        if q_start > NOW:
-             break
-        
-        # Cap the end date at the current time if it's the current quarter
-        if q_end > NOW:
-            q_end = NOW
-        
-        tables.append({
-            'name': table_name, 
-            'start': q_start, 
-            'end': q_end
-        })
-
-        # Advance to the next quarter
-        current_date = next_quarter_start
-        
-        # Break condition if we've processed up to the current quarter
-        if year == NOW.year and quarter == get_quarter(NOW.month):
-            break
-
-    return tables
-
-# --- Helper Function: Time Difference (from previous script) ---
-def time_difference(start_dt_str, finish_dt_str):
-    """Calculates the time difference in hours between two datetime strings."""
-    datetime_format = '%m/%d/%Y %H:%M:%S'
-    
-    def safe_parse(dt_str):
-        if '24:00:00' in dt_str:
-            dt_str = dt_str.replace('24:00:00', '23:59:59')
-        return datetime.strptime(dt_str, datetime_format)
-        
-    try:
-        time1 = safe_parse(start_dt_str)
-        time2 = safe_parse(finish_dt_str)
-    except ValueError:
-        return 0.0 # Handle case where date/time format is invalid
-
-    delta_seconds = abs((time1 - time2).total_seconds())
-    return delta_seconds / 3600.0
-
-# --- Core Logic Function: KPI Calculation for a Single Machine/Period ---
-def calculate_kpis_for_quarter(cursor, machine_id, q_start, q_end):
-    """
-    Calculates DT, MTTR, MTBR, and COUNT for a specific machine within a quarter.
-    """
-    
-    # 1. Prepare Date Strings and SQL
-    # SQL date format must match what's stored in REPORTS (MM/DD/YYYY)
-    start_date_str = q_start.strftime('%m/%d/%Y')
-    end_date_str = q_end.strftime('%m/%d/%Y')
-    
-    # SQL to fetch relevant reports (ordered for MTBR calculation)
-    sql_query = '''
-        SELECT DOWNTIME, START_DATE, START_TIME, FINISH_DATE, FINISH_TIME
-        FROM REPORTS
-        WHERE BREAKDOWN = 'X' AND EQUIPMENT = ?
-        AND START_DATE BETWEEN ? AND ? 
-        ORDER BY START_DATE, START_TIME ASC
-    '''
-    cursor.execute(sql_query, (machine_id, start_date_str, end_date_str))
-    results = cursor.fetchall()
-    
-    # 2. Process results
-    total_downtime = 0.0
-    failure_count = 0
-    total_operational_time = 0.0
-    last_finish_dt_str = None
-    
-    period_start_dt_str = f"{q_start.strftime('%m/%d/%Y')} 00:00:00"
-    period_end_dt_str = f"{q_end.strftime('%m/%d/%Y %H:%M:%S')}"
-    
-    if results:
-        # Time from quarter start to first failure
-        first_report = results[0]
-        first_start_dt_str = f"{first_report[1]} {first_report[2]}"
-        time_to_first = time_difference(period_start_dt_str, first_start_dt_str)
-        total_operational_time += time_to_first
-        
-        # Calculate time between failures and total downtime/count
-        for row in results:
-            downtime_minutes = row[0] if row[0] else 0
-            start_date, start_time, finish_date, finish_time = row[1], row[2], row[3], row[4]
-            
-            # Get the report's end time
-            current_finish_date = finish_date if finish_date else start_date
-            current_finish_time = finish_time if finish_time else start_time
-            current_finish_dt_str = f"{current_finish_date} {current_finish_time}"
-            
-            # DT and COUNT Calculation
-            total_downtime += downtime_minutes / 60.0 # Assuming DOWNTIME is in minutes
-            failure_count += 1
-            
-            # MTBR Calculation (Time between failure finish and next failure start)
-            if last_finish_dt_str:
-                time_between_failures = time_difference(last_finish_dt_str, f"{start_date} {start_time}")
-                total_operational_time += time_between_failures
-            
-            last_finish_dt_str = current_finish_dt_str
-
-        # Time from last failure to quarter end
-        if last_finish_dt_str:
-            time_from_last = time_difference(last_finish_dt_str, period_end_dt_str)
-            total_operational_time += time_from_last
-    
-    # 3. Final KPI Calculation
-    mttr_avg = total_downtime / failure_count if failure_count > 0 else 0.0
-    mtbr_avg = total_operational_time / failure_count if failure_count > 0 else 0.0
-
-    return (round(total_downtime, 2), round(mttr_avg, 2), 
-            round(mtbr_avg, 2), failure_count)
+# Name of this job's row in kpi_watermark
+WATERMARK_NAME = 'mtbrQuarter'
 
+KPI_COLUMNS = ['DT', 'MTTR', 'MTBR', 'COUNT']
 
-# --- Main Execution ---
-script_start = time.time()
-total_updates = 0
-
-try:
-    with sqlite3.connect(DB_PATH) as db:
-        cursor = db.cursor()
 
-        # Get list of all machine EQUIPMENT IDs from any table (e.g., Q1_2016 for full set)
-        cursor.execute("SELECT EQUIPMENT FROM Q1_2016") 
-        machines_to_update = [row[0] for row in cursor.fetchall()]
+# --- Plan and Write Stages (also used by pipeline.py) ---
+def plan_work(cursor, periods_by_key, full=False):
+    """
+    Decides which (quarter, machine) pairs to recalculate.
 
-        # Generate all quarter names and date ranges
-        quarterly_periods = generate_quarter_tables(START_YEAR)
+    Returns (machines, work, dirty_rows, mode): work is (year, quarter) -> machines to
+    recalculate, in quarter order; dirty_rows, (EQUIPMENT, YEAR, QUARTER, SEQ), are
+    cleared by write_quarter_kpis.
+    """
+    # Get list of all machine EQUIPMENT IDs from the first quarter (full set)
+    cursor.execute("SELECT EQUIPMENT FROM quarterly_kpi WHERE YEAR = ? AND QUARTER = 1", (START_YEAR,))
+    machines_to_update = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute("SELECT EQUIPMENT, YEAR, QUARTER, SEQ FROM dirty_quarters")
+    dirty_rows = cursor.fetchall()
+    # Rows mbtrMachineUpdate.py added for new machines (or new quarters) that no run has filled
+    cursor.execute("SELECT EQUIPMENT, YEAR, QUARTER FROM quarterly_kpi WHERE COUNT IS NULL")
+    unfilled_rows = cursor.fetchall()
+    cursor.execute("SELECT YEAR, QUARTER FROM kpi_watermark WHERE NAME = ?", (WATERMARK_NAME,))
+    watermark = cursor.fetchone()
+
+    work = {}
+    if full or watermark is None:
+        # Rebuild everything (also used for the first run, before any watermark exists)
+        for key in periods_by_key:
+            work[key] = dict.fromkeys(machines_to_update)
+    else:
+        # Quarters since the last run were capped at that run's time, so redo them for all machines
+        for key in periods_by_key:
+            if key >= tuple(watermark):
+                work[key] = dict.fromkeys(machines_to_update)
+        # Closed quarters only where reports were added or changed, or where a machine has
+        # rows no run has filled yet (a report of a new machine may have been imported, and
+        # its mark cleared, before its rows existed). All machines are recalculated there
+        # so the quarter's rollups stay complete; with the pre-parsed intervals that costs
+        # a binary search per machine.
+        pairs = [row[:3] for row in dirty_rows] + unfilled_rows
+        for machine, year, quarter in sorted(pairs, key=lambda row: (row[1], row[2])):
+            if (year, quarter) in periods_by_key:
+                work.setdefault((year, quarter), dict.fromkeys(machines_to_update))[machine] = None
+
+    mode = 'full' if full or watermark is None else 'incremental'
+    return machines_to_update, work, dirty_rows, mode
+
+def write_quarter_kpis(cursor, work, totals, dirty_rows, current_quarter):
+    """
+    Writes quarterly_kpi and quarterly_rollup from calculate_quarter_totals results, without committing.
 
-        print(f"Processing {len(quarterly_periods)} quarterly periods for {len(machines_to_update)} machines.")
+    Clears the dirty_rows not marked again since plan_work read them, and moves the
+    watermark to current_quarter, a (year, quarter).
+    Returns (quarterly_kpi rows changed, rollups, quarterly_rollup rows changed).
+    """
+    # Stage the quarterly KPI rows in primary key order, so the write is the same
+    # whatever the number of workers, and apply them with one UPDATE ... FROM that
+    # only rewrites the rows whose values changed
+    rows_changed = update_changed(cursor, 'quarterly_kpi', ['EQUIPMENT', 'YEAR', 'QUARTER'], KPI_COLUMNS, (
+        (*totals_kpis(*quarter_totals), machine, year, quarter)
+        for (machine, year, quarter), quarter_totals in sorted(totals.items())
+    ))
+
+    # Plant / department / work center rollups of every recalculated quarter,
+    # from the same totals and weighted by failure count
+    create_rollup_tables(cursor)
+    machine_groups = load_machine_groups(cursor)
+    rollup_rows = []
+    for year, quarter in sorted(work):
+        quarter_totals = {machine: [totals[(machine, year, quarter)]] for machine in work[(year, quarter)]}
+        for (level, name), (machines, (group_totals,)) in rollup_totals(quarter_totals, machine_groups).items():
+            rollup_rows.append((level, name, year, quarter, *totals_kpis(*group_totals), machines))
+    # The recalculated quarters end up holding exactly these rollups
+    rollups_changed = replace_changed(cursor, 'quarterly_rollup', ['LEVEL', 'NAME', 'YEAR', 'QUARTER'],
+                                      [*KPI_COLUMNS, 'MACHINES'], rollup_rows, ('YEAR', 'QUARTER'))
+
+    # Everything that was dirty has now been recalculated. A pair whose SEQ changed was
+    # marked again by a report written since plan_work read it, so it stays for the next run.
+    cursor.executemany("DELETE FROM dirty_quarters WHERE EQUIPMENT = ? AND YEAR = ? AND QUARTER = ? AND SEQ IS ?",
+                       dirty_rows)
+
+    # Record the current quarter as the new watermark
+    cursor.execute('''
+        INSERT INTO kpi_watermark(NAME, YEAR, QUARTER) VALUES (?, ?, ?)
+        ON CONFLICT(NAME) DO UPDATE SET YEAR = excluded.YEAR, QUARTER = excluded.QUARTER
+    ''', (WATERMARK_NAME, *current_quarter))
+    # Tells readers such as kpiServer.py that the KPIs were rewritten
+    bump_generation(cursor, WATERMARK_NAME)
+    return rows_changed, len(rollup_rows), rollups_changed
 
-        for period in quarterly_periods:
-            table_name = period['name']
-            q_start = period['start']
-            q_end = period['end']
 
-            for machine in machines_to_update:
-                # Calculate KPIs for the current machine and quarter
-                dt, mttr, mtbr, count = calculate_kpis_for_quarter(cursor, machine, q_start, q_end)
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description='Recalculate the quarterly KPIs in quarterly_kpi.')
+    parser.add_argument('--full', action='store_true',
+                        help='Recalculate every machine for every quarter since START_YEAR (audit mode).')
+    parser.add_argument('--verify', action='store_true',
+                        help='Recalculate every updated row with the per-machine queries and report any mismatch.')
+    parser.add_argument('--backend', choices=['auto', 'python', 'numpy'], default='auto',
+                        help='KPI engine to use; auto picks numpy when it is installed.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes, each calculating a share of the machines (default 1).')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='Copy the tables the calculation reads into memory and calculate from the copy; '
+                             'only the changed KPI rows are written back.')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.backend == 'numpy' and not vectorized.HAVE_NUMPY:
+        parser.error('the numpy backend needs NumPy installed')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.in_memory and args.workers > 1:
+        parser.error('--in-memory calculates in this process and cannot be combined with --workers')
+    use_numpy = args.backend == 'numpy' or (args.backend == 'auto' and vectorized.HAVE_NUMPY)
+
+    script_start = time.time()
+    instrument.start_run(args)
+    total_updates = 0
 
-                # Update the quarterly table
-                sql_update = f'''
-                    UPDATE {table_name} 
-                    SET DT = ?, MTTR = ?, MTBR = ?, COUNT = ? 
-                    WHERE EQUIPMENT = ?
-                '''
-                cursor.execute(sql_update, (dt, mttr, mtbr, count, machine))
-                total_updates += 1
+    try:
+        with connect() as db:
+            instrument.trace(db)
+            cursor = db.cursor()
+
+            # Generate all quarter names and date ranges
+            quarterly_periods = quarter_periods(START_YEAR)
+            periods_by_key = {(period['year'], period['quarter']): period for period in quarterly_periods}
+
+            with instrument.phase('setup'):
+                ensure_tracking_tables(cursor)
+                # Adds the unfilled-rows index plan_work reads to databases created before it
+                create_quarterly_kpi(cursor)
+                # Builds the pre-parsed intervals on the first run; committed so the workers see them
+                ensure_breakdown_intervals(cursor)
+                db.commit()
+
+            # With --in-memory the calculation reads a copy of the intervals (and the
+            # reports for --verify) in RAM; the writes below still go to the file
+            read_cursor = cursor
+            if args.in_memory:
+                with instrument.phase('snapshot'):
+                    snapshot_start = time.perf_counter()
+                    memory = snapshot(['breakdown_intervals', *(['reports', 'report_archives'] if args.verify else [])])
+                    read_cursor = memory.cursor()
+                print(f"Copied the calculation's tables into memory in {time.perf_counter() - snapshot_start:.2f} seconds.")
+
+            machines_to_update, work, dirty_rows, mode = plan_work(cursor, periods_by_key, args.full)
+            print(f"Processing {len(work)} quarterly periods ({mode}) for {len(machines_to_update)} machines.")
+
+            # Calculate every (quarter, machine) pair, split over --workers processes by equipment
+            # (the workers' time shows as 'compute')
+            work_machines = set().union(*work.values())
+            instrument.count('machines', len(work_machines))
+            with instrument.phase('compute'):
+                totals = run_sharded(calculate_quarter_totals, read_cursor, list(work_machines),
+                                     (work, periods_by_key, use_numpy), args.workers)
+            results = {pair: totals_kpis(*pair_totals) for pair, pair_totals in totals.items()}
+
+            # Optionally check the batch results against the per-machine calculation
+            if args.verify:
+                with instrument.phase('verify'):
+                    # The reference queries read reports; archived years only if a recalculated
+                    # quarter falls in one (usually only the open quarter is recalculated)
+                    windows = [(periods_by_key[key]['start'], periods_by_key[key]['end']) for key in work]
+                    archive_years = attach_archives(read_cursor, *window_ts_range(windows))
+                    if archive_years:
+                        print(f"Attached the report archives of {', '.join(map(str, archive_years))} for --verify.")
+                    mismatches = 0
+                    for (machine, year, quarter), quarter_kpis in sorted(results.items()):
+                        period = periods_by_key[(year, quarter)]
+                        expected = calculate_kpis_for_quarter(read_cursor, machine, period['start'], period['end'])
+                        if not kpis_match(expected, quarter_kpis):
+                            mismatches += 1
+                            print(f"Mismatch for {machine} Q{quarter} {year}: expected {expected}, got {quarter_kpis}")
+                    instrument.count('mismatches', mismatches)
+                    detach_archives(read_cursor, archive_years)
+                print(f"Verified {len(results)} quarterly rows, {mismatches} mismatches.")
+
+            write_start = time.perf_counter()
+            with instrument.phase('write'):
+                total_updates = len(results)
+                rows_changed, rollup_count, rollups_changed = write_quarter_kpis(
+                    cursor, work, totals, dirty_rows, (quarterly_periods[-1]['year'], quarterly_periods[-1]['quarter']))
+                instrument.count('rows_written', rows_changed)
+                instrument.count('rollups_written', rollups_changed)
+
+            with instrument.phase('commit'):
+                db.commit()
+            if args.in_memory:
+                memory.close()
+                print(f"Wrote back the changed rows in {time.perf_counter() - write_start:.2f} seconds.")
+            print(f"Successfully processed {total_updates} records and {rollup_count} rollups "
+                  f"({rows_changed} records and {rollups_changed} rollups changed).")
+
+    except sqlite3.Error as e:
+        print(f"\n[ERROR] A database error occurred: {e}")
+        
+    except Exception as e:
+        print(f"\n[FATAL ERROR] An unexpected error occurred: {e}")
 
-        db.commit()
-        print(f"Successfully processed and updated {total_updates} records.")
 
-except sqlite3.Error as e:
-    print(f"\n[ERROR] A database error occurred: {e}")
-    
-except Exception as e:
-    print(f"\n[FATAL ERROR] An unexpected error occurred: {e}")
+    # Script timer
+    script_end = time.time()
+    print(f"Script finished in {round(script_end - script_start, 2)} seconds.")
+    instrument.finish_run(args)
 
 
-# Script timer
-script_end = time.time()
-print(f"Script finished in {round(script_end - script_start, 2)} seconds.")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Runs the whole refresh as one pipeline: machine list, reports, quarterly rows and KPIs.
+
+The stages form a DAG and run in sequence, in dependency order, and a stage whose
+dependency failed is skipped. They all write, and SQLite allows one writer at a time, so
+running them side by side would only have them wait on each other's locks
+(reportUpdate.py keeps its write transaction open for the whole file). The overlap is
+within the stages: reportUpdate.py parses the CSV while the previous chunk is inserted,
+and the yearly (mtbr.py) and quarterly (mtbrQuarter.py) KPIs are one 'kpis' stage that
+reads the breakdown intervals once for both.
+
+    python pipeline.py --dry-run
+    python pipeline.py --machines-csv "machine list.csv" --reports-csv reports.csv --workers 4
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from functools import partial
+
+from maintenance import connect, quarter_periods, vectorized
+from maintenance.kpi import compute_totals
+from maintenance.parallel import run_sharded
+from maintenance.schema import create_quarterly_kpi, ensure_breakdown_intervals, ensure_tracking_tables
+
+import mtbr
+import mtbrQuarter
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stage:
+    """One pipeline step: a script run as a child process or a function run in-process."""
+
+    def __init__(self, name, deps=(), script=None, args=(), function=None, description=''):
+        self.name = name
+        self.deps = list(deps)
+        self.script = script
+        self.args = list(args)
+        self.function = function
+        self.description = description
+
+    def command(self):
+        if self.script:
+            return ' '.join([self.script, *self.args])
+        return f"{getattr(self.function, 'func', self.function).__name__}() in-process"
+
+
+# --- Stage: Yearly and Quarterly KPIs in One Pass ---
+def refresh_kpis(workers, use_numpy, full):
+    """The mtbr.py and mtbrQuarter.py jobs from one read of breakdown_intervals, in one transaction."""
+    with connect() as db:
+        cursor = db.cursor()
+        ensure_tracking_tables(cursor)
+        create_quarterly_kpi(cursor)
+        ensure_breakdown_intervals(cursor)
+        db.commit()
+
+        cursor.execute("SELECT EQUIPMENT FROM kpi")
+        kpi_machines = [row[0] for row in cursor.fetchall()]
+        quarterly_periods = quarter_periods(mtbrQuarter.START_YEAR)
+        periods_by_key = {(period['year'], period['quarter']): period for period in quarterly_periods}
+        _, work, dirty_rows, mode = mtbrQuarter.plan_work(cursor, periods_by_key, full)
+
+        machines = set(kpi_machines).union(*work.values())
+        totals = run_sharded(compute_totals, cursor, sorted(machines),
+                             (mtbr.KPI_PERIODS, work, periods_by_key, use_numpy), workers)
+
+        kpi_totals = {machine: totals[machine][0] for machine in kpi_machines}
+        quarter_totals = {(machine, year, quarter): pair_totals
+                          for machine, (_, machine_quarters) in totals.items()
+                          for (year, quarter), pair_totals in machine_quarters.items()}
+        kpis_changed, rollups, _ = mtbr.write_kpis(cursor, kpi_totals)
+        rows_changed, _, _ = mtbrQuarter.write_quarter_kpis(
+            cursor, work, quarter_totals, dirty_rows, (quarterly_periods[-1]['year'], quarterly_periods[-1]['quarter']))
+        db.commit()
+
+    return (f"{len(kpi_machines)} machines ({kpis_changed} changed), {len(rollups)} rollups, "
+            f"{len(quarter_totals)} quarterly rows in {len(work)} quarters ({mode}, {rows_changed} changed)")
+
+
+def build_stages(args):
+    """The refresh DAG for the command line options."""
+    use_numpy = args.backend == 'numpy' or (args.backend == 'auto' and vectorized.HAVE_NUMPY)
+    import_args = ['--bulk'] if args.bulk else []
+    stages = [
+        Stage('machines', script='machineUpdate.py', args=['--csv', args.machines_csv] if args.machines_csv else [],
+              description='import the machine list'),
+        Stage('reports', script='reportUpdate.py',
+              args=(['--csv', args.reports_csv] if args.reports_csv else []) + import_args,
+              description='import reports.csv (parsing overlaps the inserts)'),
+        Stage('quarter_rows', deps=['machines'], script='mbtrMachineUpdate.py',
+              description='add quarterly_kpi rows for new machines and quarters'),
+        Stage('kpis', deps=['reports', 'quarter_rows'], function=partial(refresh_kpis, args.workers, use_numpy, args.full),
+              description='yearly and quarterly KPIs and rollups from one interval load'),
+    ]
+    skipped = set(args.skip)
+    for stage in stages:
+        stage.deps = [dep for dep in stage.deps if dep not in skipped]
+    return [stage for stage in stages if stage.name not in skipped]
+
+def plan_levels(stages):
+    """
+    Groups the stages into levels; every stage's dependencies are in earlier levels.
+
+    >>> [[s.name for s in level] for level in plan_levels([Stage('b', ['a']), Stage('a'), Stage('c')])]
+    [['a', 'c'], ['b']]
+    """
+    done = set()
+    levels = []
+    remaining = list(stages)
+    while remaining:
+        level = [stage for stage in remaining if set(stage.deps) <= done]
+        if not level:
+            raise ValueError(f"dependency cycle or unknown stage among {[stage.name for stage in remaining]}")
+        levels.append(level)
+        done.update(stage.name for stage in level)
+        remaining = [stage for stage in remaining if stage.name not in done]
+    return levels
+
+
+# --- Runner ---
+def run_stage(stage, finished, started_at, timings):
+    """Runs the stage unless one of its dependencies failed, and records its timing."""
+    for dep in stage.deps:
+        if not finished[dep]:
+            timings[stage.name] = {'status': 'skipped', 'reason': f'{dep} failed'}
+            print(f"[{stage.name}] skipped because {dep} failed")
+            return False
+
+    start = time.perf_counter()
+    print(f"[{stage.name}] started: {stage.command()}")
+    try:
+        if stage.script:
+            # The exit status decides: the scripts also print [ERROR] for problems they get past
+            with subprocess.Popen([sys.executable, os.path.join(ROOT, stage.script), *stage.args],
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=ROOT,
+                                  text=True, errors='replace') as process:
+                last_line = ''
+                for line in process.stdout:
+                    line = line.rstrip()
+                    if line:
+                        print(f"[{stage.name}] {line}")
+                        last_line = line
+            ok = process.returncode == 0
+        else:
+            last_line = stage.function()
+            print(f"[{stage.name}] {last_line}")
+            ok = True
+    except sqlite3.Error as e:
+        print(f"[{stage.name}] [ERROR] A database error occurred: {e}")
+        ok, last_line = False, str(e)
+    except Exception as e:
+        # Any other failure only fails this stage, so the summary and --json are still written
+        print(f"[{stage.name}] [FATAL ERROR] An unexpected error occurred: {e!r}")
+        ok, last_line = False, repr(e)
+
+    end = time.perf_counter()
+    timings[stage.name] = {
+        'status': 'ok' if ok else 'failed',
+        'started': round(start - started_at, 3),
+        'seconds': round(end - start, 3),
+        'last_line': last_line,
+    }
+    print(f"[{stage.name}] {'finished' if ok else 'FAILED'} in {end - start:.2f} s")
+    return ok
+
+def run_pipeline(stages):
+    """Runs the stages one after another in dependency order; returns the per-stage timings."""
+    finished = {}
+    timings = {}
+    started_at = time.perf_counter()
+    for level in plan_levels(stages):
+        for stage in level:
+            finished[stage.name] = run_stage(stage, finished, started_at, timings)
+    return timings
+
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description='Run the import and KPI scripts as one pipeline.')
+    parser.add_argument('--machines-csv', help='Machine list export (default: machineUpdate.py CSV_PATH).')
+    parser.add_argument('--reports-csv', help='Reports export (default: reportUpdate.py CSV_PATH).')
+    parser.add_argument('--bulk', action='store_true', help='Import the reports with reportUpdate.py --bulk.')
+    parser.add_argument('--full', action='store_true', help='Recalculate every quarter, like mtbrQuarter.py --full.')
+    parser.add_argument('--backend', choices=['auto', 'python', 'numpy'], default='auto',
+                        help='KPI engine to use; auto picks numpy when it is installed.')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for the KPI stage (default 1).')
+    parser.add_argument('--skip', action='append', default=[], metavar='STAGE',
+                        help='Leave a stage out, e.g. --skip machines when the machine list did not change.')
+    parser.add_argument('--dry-run', action='store_true', help='Print the stages in the order they run, run nothing.')
+    parser.add_argument('--json', help='Write the per-stage timings to this JSON file.')
+    args = parser.parse_args()
+
+    if args.backend == 'numpy' and not vectorized.HAVE_NUMPY:
+        parser.error('the numpy backend needs NumPy installed')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    stages = build_stages(args)
+    if args.dry_run:
+        print("The stages run in sequence:")
+        order = [stage for level in plan_levels(stages) for stage in level]
+        for number, stage in enumerate(order, 1):
+            after = f" (needs {', '.join(stage.deps)})" if stage.deps else ''
+            print(f"  {number}. {stage.name:<13} {stage.description}{after}")
+            print(f"     {'':<13} {stage.command()}")
+        return
+
+    start = time.perf_counter()
+    timings = run_pipeline(stages)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{'stage':<13} {'status':<8} {'start s':>8} {'seconds':>8}")
+    for stage in stages:
+        timing = timings[stage.name]
+        if timing['status'] == 'skipped':
+            print(f"{stage.name:<13} {'skipped':<8}")
+            continue
+        print(f"{stage.name:<13} {timing['status']:<8} {timing['started']:8.2f} {timing['seconds']:8.2f}")
+    print(f"Pipeline finished in {elapsed:.2f} seconds.")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'seconds': round(elapsed, 3), 'stages': timings}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,66 +1,355 @@
+import argparse
+import io
+import queue
 import sqlite3
+import sys
 import csv
+import threading
+import time
+
+from maintenance import connect, instrument, report_timestamps
+from maintenance.archive import archived_years
+from maintenance.manifest import csv_paths, high_water_mark, plan_import, record_import
+from maintenance.schema import ensure_dirty_tracking, ensure_downtime_index
 
 # --- Configuration ---
-# Choose the desired database path (use raw string r'...' for Windows paths)
-DB_PATH = r'C:\Projects\Musashi\maintenance.db'
+# Choose the CSV path (use raw string r'...' for Windows paths).
+# The database path comes from MAINTENANCE_DB / maintenance.ini (see maintenance/db.py).
 CSV_PATH = r'C:\Projects\Musashi\reports.csv'
 
+# Rows sent to SQLite per executemany; memory use depends on this, not on the file size
+BATCH_SIZE = 5000
+# Batches parsed ahead by the reader thread while the previous one is inserted
+READ_AHEAD = 2
+# Minimum number of seconds between progress lines
+PROGRESS_SECONDS = 2.0
+# Page cache used by --bulk, in KiB (negative cache_size means KiB in SQLite)
+BULK_CACHE_KIB = 262144
+
+# Columns of the reports table, in the order read_reports yields them
+REPORT_COLUMNS = [
+    'NOTIFICATION', 'DATE', 'DESCRIPTION', 'PLANT', 'DEPARTMENT', 'WORK_CENTER',
+    'EQUIPMENT', 'BREAKDOWN', 'DOWNTIME', 'REPORTED', 'START_DATE', 'START_TIME',
+    'FINISH_DATE', 'FINISH_TIME', 'START_TS', 'FINISH_TS',
+]
+
+
+# --- Helper Function: Streaming CSV Reader ---
+def read_reports(csv_path, offset=0):
+    """
+    Yields one reports-table record per CSV row, reading the file as a stream.
+
+    offset: byte position of the first row to read, e.g. the end of the part of an
+    appended export that was imported before; 0 reads the whole file after the header.
+    """
+    with open(csv_path, 'rb') as raw:
+        raw.seek(offset)
+        f = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        csvreader = csv.reader(f)
+        if not offset:
+            next(csvreader) # Skip the header row
+
+        for row in csvreader:
+            # Map the CSV columns to the required table order.
+            # [0]NOTIFICATION, [1]DATE, [2]DESCRIPTION, [3]PLANT, [4]DEPARTMENT, 
+            # [5]WORK_CENTER, [6]EQUIPMENT, [7]BREAKDOWN, [8]DOWNTIME, 
+            # [10]REPORTED, [11]START_DATE, [12]START_TIME, [13]FINISH_DATE, [14]FINISH_TIME
+            # Note: We skip row[9] in the CSV list as per your indexing (REPORTED is [10])
+            # START_TS and FINISH_TS are derived from [11]-[14] for range queries
+            yield (
+                row[0], row[1], row[2], row[3], row[4], row[5],
+                row[6], row[7], row[8], row[10], row[11], row[12],
+                row[13], row[14], *report_timestamps(row[11], row[12], row[13], row[14])
+            )
+
+def merge_staged_reports(cursor):
+    """
+    Merges reports_staging into reports with one upsert and returns (added, updated).
+
+    Notifications edited in SAP since the last export (e.g. a changed FINISH_TIME or
+    DOWNTIME) are updated. Rows that are identical are left alone, so they are not
+    rewritten and do not mark their quarter dirty. A NOTIFICATION listed more than once
+    in the file is merged once, from its last row.
+    """
+    # Without this the upsert would insert the first copy and update it from the next,
+    # and count both
+    cursor.execute('''
+        DELETE FROM reports_staging
+        WHERE NOTIFICATION IS NOT NULL
+          AND rowid NOT IN (SELECT MAX(rowid) FROM reports_staging GROUP BY NOTIFICATION)
+    ''')
+    cursor.execute('''
+        SELECT COUNT(*) FROM reports_staging s
+        WHERE NOT EXISTS (SELECT 1 FROM reports r WHERE r.NOTIFICATION = s.NOTIFICATION)
+    ''')
+    rows_new = cursor.fetchone()[0]
+
+    columns = ', '.join(REPORT_COLUMNS)
+    updates = ', '.join(f'{column} = excluded.{column}' for column in REPORT_COLUMNS[1:])
+    changed = ' OR '.join(f'reports.{column} IS NOT excluded.{column}' for column in REPORT_COLUMNS[1:])
+    # "WHERE true" is required by SQLite to tell the upsert clause apart from a join
+    cursor.execute(f'''
+        INSERT INTO reports({columns})
+        SELECT {columns} FROM reports_staging WHERE true
+        ON CONFLICT(NOTIFICATION) DO UPDATE SET {updates}
+        WHERE {changed}
+    ''')
+    return rows_new, cursor.rowcount - rows_new
+
+def batched(records, batch_size):
+    """Groups an iterable of records into lists of at most batch_size records."""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def read_ahead(batches, depth=READ_AHEAD):
+    """
+    Yields the batches of another iterable, producing up to depth of them in a background thread.
+
+    The CSV is read and its dates converted while SQLite inserts the previous batch
+    (the sqlite3 module releases the GIL while SQLite runs). An error in the reader,
+    e.g. a missing file, is raised here in the caller's thread.
+    """
+    ready = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def reader():
+        try:
+            for batch in batches:
+                if stop.is_set():
+                    return
+                ready.put(batch)
+            ready.put(done)
+        except BaseException as e:
+            ready.put(e)
+
+    thread = threading.Thread(target=reader, name='read_ahead', daemon=True)
+    thread.start()
+    try:
+        while True:
+            batch = ready.get()
+            if batch is done:
+                return
+            if isinstance(batch, BaseException):
+                raise batch
+            yield batch
+    finally:
+        # The caller stopped early: let the reader finish its current put and exit
+        stop.set()
+        while thread.is_alive():
+            try:
+                ready.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def import_records(cursor, records, sql_insert, batch_size):
+    """
+    Inserts records in batches, one savepoint per batch, inside the caller's transaction.
+
+    Returns (rows read, rows inserted, rows failed, highest NOTIFICATION, highest START_TS).
+    """
+    total_records = 0
+    rows_added = 0
+    rows_failed = 0
+    notifications = []
+    start_timestamps = []
+    import_start = last_progress = time.perf_counter()
+
+    # A chunk that fails is rolled back on its own; everything else is committed together.
+    # The CSV is parsed in a reader thread while the previous batch is inserted; waiting
+    # for the next batch is timed as 'parse', the inserts as 'write'
+    for batch in instrument.timed(read_ahead(batched(records, batch_size)), 'parse'):
+        cursor.execute('SAVEPOINT chunk')
+        try:
+            with instrument.phase('write'):
+                cursor.executemany(sql_insert, batch)
+            rows_added += cursor.rowcount
+            cursor.execute('RELEASE chunk')
+            # The high-water marks for ingest_manifest, from the batches that went in
+            notifications.append(max((int(record[0]) for record in batch if record[0].isdigit()), default=None))
+            start_timestamps.append(max((record[-2] for record in batch if record[-2] is not None), default=None))
+        except sqlite3.Error as e:
+            cursor.execute('ROLLBACK TO chunk')
+            cursor.execute('RELEASE chunk')
+            rows_failed += len(batch)
+            print(f"[ERROR] Chunk starting at notification {batch[0][0]} was skipped: {e}")
+        total_records += len(batch)
+
+        now = time.perf_counter()
+        if now - last_progress >= PROGRESS_SECONDS:
+            print(f'{total_records} rows read ({total_records / (now - import_start):.0f} rows/sec)')
+            last_progress = now
+
+    max_notification = max((value for value in notifications if value is not None), default=None)
+    max_start_ts = max((value for value in start_timestamps if value is not None), default=None)
+    return total_records, rows_added, rows_failed, max_notification, max_start_ts
+
+
 # --- Main Execution ---
+parser = argparse.ArgumentParser(description='Import a reports.csv export, or a directory of them, into the reports table.')
+parser.add_argument('--csv', default=CSV_PATH,
+                    help='Path of the reports CSV export, or of a directory whose .csv files are imported in name order.')
+parser.add_argument('--db', help='Path of maintenance.db (default: MAINTENANCE_DB / maintenance.ini).')
+parser.add_argument('--bulk', action='store_true',
+                    help='Bulk-load mode: a larger page cache, rows are loaded into a staging table '
+                         'and merged, updating notifications that changed.')
+parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                    help=f'Rows per executemany chunk (default {BATCH_SIZE}).')
+parser.add_argument('--force', action='store_true',
+                    help='Read every file in full, even if ingest_manifest shows it unchanged or only appended.')
+parser.add_argument('--since-high-water', action='store_true',
+                    help='Skip rows whose NOTIFICATION is not above the highest one imported so far; '
+                         'for exports whose old notifications never change (edits are not picked up).')
+instrument.add_arguments(parser)
+args = parser.parse_args()
+instrument.start_run(args)
+
+# SQL Statement: Use INSERT OR IGNORE and parameter placeholders.
+# In bulk mode the rows go to the unindexed staging table instead.
+target_table = 'reports_staging' if args.bulk else 'reports'
+sql_insert = f'''
+    INSERT {'' if args.bulk else 'OR IGNORE '}INTO {target_table}({', '.join(REPORT_COLUMNS)})
+    VALUES ({', '.join('?' * len(REPORT_COLUMNS))})
+'''
+
 try:
-    # Use 'with' statement for safe and automatic closing of the connection
-    with sqlite3.connect(DB_PATH) as db:
+    # Use 'with' statement for safe and automatic closing of the connection.
+    # isolation_level=None lets us manage the outer transaction and savepoints ourselves.
+    with connect(args.db, isolation_level=None) as db:
+        instrument.trace(db)
         cursor = db.cursor()
 
-        # 1. Read all report data from the CSV file
-        report_data = []
-        with open(CSV_PATH, 'r', newline='', encoding='utf-8') as f:
-            csvreader = csv.reader(f)
-            next(csvreader) # Skip the header row
-            
-            for row in csvreader:
-                # Map the CSV columns to the required table order.
-                # [0]NOTIFICATION, [1]DATE, [2]DESCRIPTION, [3]PLANT, [4]DEPARTMENT, 
-                # [5]WORK_CENTER, [6]EQUIPMENT, [7]BREAKDOWN, [8]DOWNTIME, 
-                # [10]REPORTED, [11]START_DATE, [12]START_TIME, [13]FINISH_DATE, [14]FINISH_TIME
-                # Note: We skip row[9] in the CSV list as per your indexing (REPORTED is [10])
-                report_record = (
-                    row[0], row[1], row[2], row[3], row[4], row[5],
-                    row[6], row[7], row[8], row[10], row[11], row[12],
-                    row[13], row[14]
-                )
-                report_data.append(report_record)
-
-        # 2. SQL Statement: Use INSERT OR IGNORE and parameter placeholders
-        sql_insert = '''
-            INSERT OR IGNORE INTO reports(
-                NOTIFICATION, DATE, DESCRIPTION, PLANT, DEPARTMENT, WORK_CENTER, 
-                EQUIPMENT, BREAKDOWN, DOWNTIME, REPORTED, START_DATE, START_TIME, 
-                FINISH_DATE, FINISH_TIME
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        '''
-
-        # 3. Execute bulk insert for massive performance improvement
-        cursor.executemany(sql_insert, report_data)
-        
-        # Calculate final counts based on the total number of records processed
-        total_records = len(report_data)
-        rows_added = cursor.rowcount
-        rows_ignored = total_records - rows_added
-
-        # Commit all changes at once
-        db.commit()
-
-        print(f'{rows_added} Reports added with {rows_ignored} reports ignored (already existed).')
+        with instrument.phase('setup'):
+            # Record the quarters touched by this import for mtbrQuarter.py
+            ensure_dirty_tracking(cursor)
+            # Keep the pre-parsed breakdown intervals the KPI scripts read, and their
+            # R*Tree for downtime.py, in step
+            ensure_downtime_index(cursor)
+            high_water = high_water_mark(cursor, 'reports') if args.since_high_water else None
+            # The years archiveReports.py moved out of reports, as [START_TS, END_TS) ranges
+            archives = archived_years(cursor)
+            archived = [(year_start, year_end) for _, _, year_start, year_end in archives]
+        if archives:
+            print(f"Reports of the archived years {', '.join(str(year) for year, *_ in archives)} are skipped.")
+
+        if args.bulk:
+            # connect() already sets WAL, synchronous=NORMAL and temp_store=MEMORY;
+            # a bigger cache means fewer misses while the reports indexes are updated
+            cursor.execute(f'PRAGMA cache_size = -{BULK_CACHE_KIB}')
+        else:
+            # Each batch's savepoint keeps a statement journal of every page the triggers
+            # touch (dirty_quarters, breakdown_intervals, breakdown_rtree). Held in memory
+            # (temp_store=MEMORY) it made the inserts several times slower; a temp file,
+            # which stays in the OS cache and is never synced, does not
+            cursor.execute('PRAGMA temp_store = FILE')
+
+        totals = dict.fromkeys(['read', 'added', 'updated', 'failed', 'skipped_files'], 0)
+        run_start = time.perf_counter()
+        csv_files = csv_paths(args.csv)
+        if not csv_files:
+            print(f'No .csv files in {args.csv}.')
+
+        for csv_path in csv_files:
+            # Unchanged exports are skipped and appended ones read from the first new row on
+            with instrument.phase('setup'):
+                action, offset, fingerprint = plan_import(cursor, csv_path, 'reports')
+            if args.force:
+                action, offset = 'forced', 0
+            if action in ('unchanged', 'touched'):
+                if action == 'touched':
+                    # Same content with a new mtime: record it, so the next run skips it without hashing
+                    cursor.execute('BEGIN')
+                    record_import(cursor, csv_path, 'reports', fingerprint, 0, append=True)
+                    cursor.execute('COMMIT')
+                totals['skipped_files'] += 1
+                print(f'{csv_path}: unchanged since its last import, skipped.')
+                continue
+            if action == 'appended':
+                print(f'{csv_path}: appended since its last import, reading from byte {offset}.')
+
+            records = read_reports(csv_path, offset)
+            if high_water is not None:
+                records = (record for record in records
+                           if not (record[0].isdigit() and int(record[0]) <= high_water))
+            if archived:
+                # They would come back into reports next to their archived copies
+                records = (record for record in records
+                           if record[-2] is None or not any(start <= record[-2] < end for start, end in archived))
+
+            # One transaction per file, with its manifest row: a file is imported completely or not at all
+            file_start = time.perf_counter()
+            cursor.execute('BEGIN')
+            if args.bulk:
+                # Same column affinities as reports, so the merge compares like with like
+                cursor.execute('DROP TABLE IF EXISTS temp.reports_staging')
+                cursor.execute(f"CREATE TEMP TABLE reports_staging AS SELECT {', '.join(REPORT_COLUMNS)} FROM reports WHERE 0")
+            total_records, rows_added, rows_failed, max_notification, max_start_ts = import_records(
+                cursor, records, sql_insert, args.batch_size)
+
+            rows_updated = 0
+            if args.bulk:
+                with instrument.phase('merge'):
+                    rows_added, rows_updated = merge_staged_reports(cursor)
+                    cursor.execute('DROP TABLE temp.reports_staging')
+            if high_water is not None:
+                # The rows skipped below the high-water mark are already in reports
+                max_notification = max(max_notification or high_water, high_water)
+            record_import(cursor, csv_path, 'reports', fingerprint, total_records, max_notification, max_start_ts,
+                          append=action == 'appended')
+
+            # Commit all changes of the file at once
+            with instrument.phase('commit'):
+                cursor.execute('COMMIT')
+
+            elapsed = time.perf_counter() - file_start
+            if args.bulk:
+                rows_unchanged = total_records - rows_added - rows_updated - rows_failed
+                print(f'{rows_added} Reports added, {rows_updated} updated and {rows_unchanged} unchanged.')
+            else:
+                rows_ignored = total_records - rows_added - rows_failed
+                print(f'{rows_added} Reports added with {rows_ignored} reports ignored (already existed).')
+            if rows_failed:
+                print(f'{rows_failed} reports were not imported because of database errors.')
+            print(f'Read {total_records} rows from {csv_path} in {round(elapsed, 2)} seconds '
+                  f'({total_records / max(elapsed, 1e-9):.0f} rows/sec).')
+            for key, value in (('read', total_records), ('added', rows_added), ('updated', rows_updated),
+                               ('failed', rows_failed)):
+                totals[key] += value
+
+        instrument.count('rows_read', totals['read'])
+        instrument.count('rows_added', totals['added'])
+        instrument.count('rows_failed', totals['failed'])
+        if args.bulk:
+            instrument.count('rows_updated', totals['updated'])
+        instrument.count('files_skipped', totals['skipped_files'])
+        if len(csv_files) > 1:
+            print(f"{len(csv_files)} files ({totals['skipped_files']} unchanged): {totals['read']} rows read, "
+                  f"{totals['added']} added, {totals['updated']} updated in "
+                  f"{round(time.perf_counter() - run_start, 2)} seconds.")
 
 except sqlite3.Error as e:
     # Catch and report specific database errors
     print(f"\n[ERROR] A database error occurred: {e}")
-except FileNotFoundError:
+    exit_status = 1
+except FileNotFoundError as e:
     # Catch file path errors
-    print(f"\n[ERROR] CSV file not found at path: {CSV_PATH}")
+    print(f"\n[ERROR] CSV file not found at path: {e.filename or args.csv}")
+    exit_status = 1
 except Exception as e:
     # Catch any other unexpected errors
     print(f"\n[FATAL ERROR] An unexpected error occurred: {e}")
+    exit_status = 1
+else:
+    exit_status = 0
 
 # The connection is automatically closed by the 'with' statement
+instrument.finish_run(args)
+# Non-zero when nothing was imported, so pipeline.py marks the stage failed
+sys.exit(exit_status)